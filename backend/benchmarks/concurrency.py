@@ -0,0 +1,63 @@
+"""Throughput of concurrent requests against a slow upstream.
+
+Runs the ASGI app in-process against FakeSupabase with an injected
+per-call latency and fires requests with bounded concurrency:
+
+    cd backend
+    python -m benchmarks.concurrency --latency 0.02 --requests 400 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("SUPABASE_URL", "https://fake.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "fake.supabase.key")
+os.environ.setdefault("RATE_LIMIT_REQUESTS", "1000000000")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase, seed_catalog  # noqa: E402
+
+
+async def run(args: argparse.Namespace) -> dict:
+    main.supabase = seed_catalog(FakeSupabase(args.latency), products=args.products)
+    transport = httpx.ASGITransport(app=main.app)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def request(i: int) -> int:
+            async with semaphore:
+                response = await client.get(f"/api/products/{i % args.products + 1}")
+                return response.status_code
+
+        start = time.perf_counter()
+        statuses = await asyncio.gather(*(request(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "latency_ms": args.latency * 1000,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(args.requests / elapsed, 1),
+        "errors": sum(1 for code in statuses if code != 200),
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.02, help="Injected upstream latency in seconds")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--products", type=int, default=1000)
+    args = parser.parse_args()
+    print(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,447 @@
+"""In-process stand-in for the supabase client used by main.py.
+
+Covers the table/select/filter/order/range/insert/update/upsert/delete
+surface, embedded selects such as ``categories(id, name)``, storage
+buckets and the auth calls. Every ``execute()`` can sleep for an
+injected latency to mimic a PostgREST round trip; the sleep blocks the
+calling thread, exactly like the real synchronous client does.
+"""
+import copy
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import jwt
+
+# Access tokens are real HS256 JWTs signed with this secret; point
+# SUPABASE_JWT_SECRET at it to exercise local verification
+FAKE_JWT_SECRET = "fake-supabase-jwt-secret-for-benchmarks"
+
+# Foreign keys used by embedded selects: relation -> (fk column, table)
+RELATIONS = {
+    "products": {
+        "categories": ("category_id", "categories"),
+        "car_brands": ("brand_id", "car_brands"),
+        "car_models": ("model_id", "car_models"),
+    },
+    "order_items": {
+        "products": ("product_id", "products"),
+        "orders": ("order_id", "orders"),
+    },
+}
+
+
+def split_top_level(text: str) -> List[str]:
+    parts, depth, current, quoted, escaped = [], 0, "", False, False
+    for ch in text:
+        if escaped:
+            escaped = False
+        elif ch == "\\" and quoted:
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == "(" and not quoted:
+            depth += 1
+        elif ch == ")" and not quoted:
+            depth -= 1
+        if ch == "," and depth == 0 and not quoted:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def compare(op: str, value: Any, other: Any) -> bool:
+    if op == "is":
+        return value is None if other in ("null", None) else value == other
+    if value is None:
+        return False
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            other = float(other)
+        except (TypeError, ValueError):
+            value, other = str(value), str(other)
+    else:
+        value, other = str(value), str(other)
+    return {
+        "eq": value == other,
+        "neq": value != other,
+        "gt": value > other,
+        "gte": value >= other,
+        "lt": value < other,
+        "lte": value <= other,
+    }[op]
+
+
+def parse_condition(expr: str) -> Callable[[dict], bool]:
+    if expr.startswith("and(") or expr.startswith("or("):
+        combine = all if expr.startswith("and(") else any
+        inner = expr[expr.index("(") + 1:-1]
+        conditions = [parse_condition(part) for part in split_top_level(inner)]
+        return lambda row: combine(c(row) for c in conditions)
+    column, op, value = expr.split(".", 2)
+    if value.startswith('"') and value.endswith('"'):
+        value = re.sub(r'\\(.)', r'\1', value[1:-1])
+    return lambda row: compare(op, row.get(column), value)
+
+
+class FakeDatabase:
+    def __init__(self, latency: float = 0.0):
+        self.tables: Dict[str, List[dict]] = {}
+        # Primary key index, so id lookups stay O(1) on 100k-row tables the
+        # way they would against Postgres
+        self.by_id: Dict[str, Dict[str, dict]] = {}
+        self.latency = latency
+        self.calls = 0
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def next_id(self, table: str) -> int:
+        self._ids[table] = self._ids.get(table, 0) + 1
+        return self._ids[table]
+
+    def seed(self, table: str, rows: List[dict]) -> None:
+        for row in rows:
+            row = dict(row)
+            if "id" not in row:
+                row["id"] = self.next_id(table)
+            elif isinstance(row["id"], int):
+                self._ids[table] = max(self._ids.get(table, 0), row["id"])
+            self.add(table, row)
+
+    def add(self, table: str, row: dict) -> None:
+        self.tables.setdefault(table, []).append(row)
+        self.by_id.setdefault(table, {})[str(row["id"])] = row
+
+    def find(self, table: str, row_id: Any) -> Optional[dict]:
+        return self.by_id.get(table, {}).get(str(row_id))
+
+    def round_trip(self) -> None:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeQuery:
+    def __init__(self, db: FakeDatabase, table: str):
+        self.db = db
+        self.table = table
+        self.path = f"/{table}"
+        self.http_method = "GET"
+        self.columns = "*"
+        self.payload: Any = None
+        self.on_conflict: Optional[str] = None
+        self.filters: List[Callable[[dict], bool]] = []
+        self.orders: List[tuple] = []
+        self.start = 0
+        self.count: Optional[int] = None
+        self.query_params: List[str] = []
+        self.id_keys: Optional[List[str]] = None
+        self.headers: Dict[str, str] = {}
+
+    @property
+    def params(self) -> str:
+        # Same shape as the query string the real builders send
+        return "&".join(self.query_params)
+
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "FakeQuery":
+        self.columns = " ".join(columns.split())
+        self.query_params.append(f"select={self.columns}")
+        if count:
+            self.headers["prefer"] = f"count={count}"
+        return self
+
+    def insert(self, data: Any) -> "FakeQuery":
+        self.http_method = "POST"
+        self.payload = data
+        return self
+
+    def upsert(self, data: Any, on_conflict: str = "id", **kwargs) -> "FakeQuery":
+        self.http_method = "POST"
+        self.payload = data
+        self.on_conflict = on_conflict
+        return self
+
+    def update(self, data: dict) -> "FakeQuery":
+        self.http_method = "PATCH"
+        self.payload = data
+        return self
+
+    def delete(self) -> "FakeQuery":
+        self.http_method = "DELETE"
+        return self
+
+    def _filter(self, op: str, column: str, value: Any) -> "FakeQuery":
+        if column == "id" and op == "eq":
+            self.id_keys = [str(value)]
+        self.filters.append(lambda row: compare(op, row.get(column), value))
+        self.query_params.append(f"{column}={op}.{value}")
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("eq", column, value)
+
+    def neq(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("neq", column, value)
+
+    def gt(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("gt", column, value)
+
+    def gte(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("gte", column, value)
+
+    def lt(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("lt", column, value)
+
+    def lte(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("lte", column, value)
+
+    def is_(self, column: str, value: Any) -> "FakeQuery":
+        return self._filter("is", column, value)
+
+    def in_(self, column: str, values: List[Any]) -> "FakeQuery":
+        wanted = {str(v) for v in values}
+        if column == "id":
+            self.id_keys = list(wanted)
+        self.filters.append(lambda row: str(row.get(column)) in wanted)
+        self.query_params.append(f"{column}=in.({','.join(str(v) for v in values)})")
+        return self
+
+    def or_(self, expr: str) -> "FakeQuery":
+        self.filters.append(parse_condition(f"or({expr})"))
+        self.query_params.append(f"or=({expr})")
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs) -> "FakeQuery":
+        self.orders.append((column, desc))
+        self.query_params.append(f"order={column}.{'desc' if desc else 'asc'}")
+        return self
+
+    def range(self, start: int, end: int) -> "FakeQuery":
+        self.start = start
+        self.count = end - start + 1
+        self.query_params += [f"offset={start}", f"limit={self.count}"]
+        return self
+
+    def limit(self, count: int) -> "FakeQuery":
+        self.count = count
+        self.query_params.append(f"limit={count}")
+        return self
+
+    def _embed(self, table: str, row: dict, columns: str) -> dict:
+        out = {}
+        for column in split_top_level(columns):
+            match = re.match(r"(\w+)\((.*)\)$", column, re.S)
+            if match:
+                relation, sub_columns = match.groups()
+                fk, target_table = RELATIONS[table][relation]
+                target = self.db.find(target_table, row.get(fk))
+                out[relation] = self._embed(target_table, target, sub_columns) if target else None
+            elif column == "*":
+                out.update(copy.deepcopy(row))
+            elif column != "count":
+                out[column] = row.get(column)
+        return out
+
+    def _insert(self, rows: List[dict]) -> List[dict]:
+        out = []
+        for payload in rows:
+            payload = dict(payload)
+            if self.on_conflict and payload.get(self.on_conflict) is not None:
+                if self.on_conflict == "id":
+                    existing = self.db.find(self.table, payload["id"])
+                else:
+                    existing = next(
+                        (r for r in rows_of(self) if r.get(self.on_conflict) == payload[self.on_conflict]),
+                        None
+                    )
+                if existing is not None:
+                    existing.update(payload)
+                    out.append(dict(existing))
+                    continue
+            payload.setdefault("id", self.db.next_id(self.table))
+            payload.setdefault("created_at", time.strftime("%Y-%m-%dT%H:%M:%S") + f".{payload['id'] % 1000000:06d}")
+            self.db.add(self.table, payload)
+            out.append(dict(payload))
+        return out
+
+    def execute(self) -> SimpleNamespace:
+        self.db.round_trip()
+        if self.http_method == "POST":
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            return SimpleNamespace(data=self._insert(payload))
+
+        if self.id_keys is not None:
+            index = self.db.by_id.get(self.table, {})
+            candidates = [index[key] for key in self.id_keys if key in index]
+        else:
+            candidates = rows_of(self)
+        matched = [row for row in candidates if all(f(row) for f in self.filters)]
+        if self.http_method == "PATCH":
+            for row in matched:
+                row.update(self.payload)
+            return SimpleNamespace(data=[dict(row) for row in matched])
+        if self.http_method == "DELETE":
+            table = rows_of(self)
+            for row in matched:
+                table.remove(row)
+                self.db.by_id.get(self.table, {}).pop(str(row["id"]), None)
+            return SimpleNamespace(data=matched)
+
+        for column, desc in reversed(self.orders):
+            matched.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=desc)
+        end = None if self.count is None else self.start + self.count
+        return SimpleNamespace(data=[
+            self._embed(self.table, row, self.columns) for row in matched[self.start:end]
+        ])
+
+
+def rows_of(query: FakeQuery) -> List[dict]:
+    return query.db.tables.setdefault(query.table, [])
+
+
+class FakeBucket:
+    def __init__(self, storage: "FakeStorage", name: str):
+        self.storage = storage
+        self.name = name
+
+    def upload(self, path: str, content: bytes, options: Optional[dict] = None) -> None:
+        self.storage.db.round_trip()
+        if (self.name, path) in self.storage.objects:
+            raise Exception("The resource already exists (409 Duplicate)")
+        self.storage.objects[(self.name, path)] = content
+
+    def get_public_url(self, path: str) -> str:
+        return f"https://fake.supabase.co/storage/v1/object/public/{self.name}/{path}?"
+
+    def remove(self, paths: List[str]) -> None:
+        self.storage.db.round_trip()
+        for path in paths:
+            self.storage.objects.pop((self.name, path), None)
+
+
+class FakeStorage:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.objects: Dict[tuple, bytes] = {}
+
+    def from_(self, bucket: str) -> FakeBucket:
+        return FakeBucket(self, bucket)
+
+
+def issue_token(user_id: str, email: Optional[str] = None, ttl: int = 3600) -> str:
+    return jwt.encode(
+        {"sub": user_id, "email": email, "aud": "authenticated", "exp": int(time.time()) + ttl},
+        FAKE_JWT_SECRET,
+        algorithm="HS256"
+    )
+
+
+class FakeAuth:
+    """Any password signs in an existing user."""
+
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    def _user(self, user_id: str) -> SimpleNamespace:
+        row = self.db.find("users", user_id) or {}
+        return SimpleNamespace(id=user_id, email=row.get("email", f"{user_id}@example.com"))
+
+    def get_user(self, token: str) -> SimpleNamespace:
+        self.db.round_trip()
+        try:
+            claims = jwt.decode(token, FAKE_JWT_SECRET, algorithms=["HS256"], audience="authenticated")
+        except jwt.InvalidTokenError:
+            return SimpleNamespace(user=None)
+        return SimpleNamespace(user=self._user(claims["sub"]))
+
+    def sign_in_with_password(self, credentials: dict) -> SimpleNamespace:
+        self.db.round_trip()
+        row = next((u for u in self.db.tables.get("users", []) if u["email"] == credentials["email"]), None)
+        if row is None:
+            raise Exception("Invalid login credentials")
+        return SimpleNamespace(
+            user=self._user(row["id"]),
+            session=SimpleNamespace(access_token=issue_token(row["id"], row["email"]))
+        )
+
+    def sign_up(self, credentials: dict) -> SimpleNamespace:
+        self.db.round_trip()
+        return SimpleNamespace(user=SimpleNamespace(id=f"user-{credentials['email']}", email=credentials["email"]))
+
+    def sign_out(self) -> None:
+        pass
+
+
+class FakeSupabase:
+    def __init__(self, latency: float = 0.0):
+        self.db = FakeDatabase(latency)
+        self.storage = FakeStorage(self.db)
+        self.auth = FakeAuth(self.db)
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self.db, name)
+
+
+BRANDS = ["Toyota", "BMW", "Kia", "Hyundai", "Nissan", "Mercedes", "Chevrolet", "Renault", "Peugeot", "Skoda"]
+CATEGORIES = ["Brakes", "Engine", "Filters", "Lights", "Suspension", "Electrical", "Cooling", "Body"]
+PARTS = ["brake pad", "oil filter", "air filter", "spark plug", "headlight", "shock absorber", "radiator", "alternator"]
+
+
+def seed_catalog(client: FakeSupabase, products: int = 1000, orders: int = 0) -> FakeSupabase:
+    db = client.db
+    db.seed("users", [{"id": "admin", "email": "admin@example.com", "role": "admin"}])
+    db.seed("car_brands", [
+        {"name": name, "description": f"{name} parts", "logo_url": "", "color": "#000000"}
+        for name in BRANDS
+    ])
+    db.seed("car_models", [
+        {"name": f"{BRANDS[i % len(BRANDS)]} M{i}", "brand_id": i % len(BRANDS) + 1}
+        for i in range(len(BRANDS) * 5)
+    ])
+    db.seed("categories", [{"name": name} for name in CATEGORIES])
+    db.seed("products", [
+        {
+            "name": f"{PARTS[i % len(PARTS)].title()} {i}",
+            "description": f"Genuine {PARTS[i % len(PARTS)]} for {BRANDS[i % len(BRANDS)]}",
+            "price": round(5 + (i * 7919) % 500 + 0.99, 2),
+            "category_id": i % len(CATEGORIES) + 1,
+            "brand_id": i % len(BRANDS) + 1,
+            "model_id": i % (len(BRANDS) * 5) + 1,
+            "stock_quantity": 5 + i % 50,
+            "image_url": "",
+            "images": [],
+            "rating": 4.5,
+            "reviews_count": (i * 31) % 200,
+            "created_at": f"2026-01-{1 + i % 28:02d}T00:00:00.{i:06d}",
+        }
+        for i in range(products)
+    ])
+    statuses = ["pending", "confirmed", "processing", "shipped", "delivered", "cancelled"]
+    for i in range(orders):
+        order_id = i + 1
+        db.seed("orders", [{
+            "id": order_id,
+            "customer_name": f"Customer {i}",
+            "customer_email": f"c{i}@example.com",
+            "customer_phone": "01000000000",
+            "customer_address": None,
+            "payment_method": "Vodafone Cash",
+            "total_amount": 100.0,
+            "deposit_amount": 50.0,
+            "status": statuses[i % len(statuses)],
+            "created_at": f"2026-02-{1 + i % 28:02d}T00:00:00.{i:06d}",
+        }])
+        db.seed("order_items", [{
+            "order_id": order_id,
+            "product_id": (i * 13) % max(products, 1) + 1,
+            "quantity": 2,
+            "price": 50.0,
+        }])
+    return client
@@ -0,0 +1,78 @@
+"""Cost of building and serializing /api/products responses.
+
+Upstream latency is zero, so the numbers are the app's own CPU time per
+request: formatting rows, encoding JSON and the ASGI round trip.
+
+    cd backend
+    python -m benchmarks.serialization --sizes 100 1000 --iterations 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("SUPABASE_URL", "https://fake.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "fake.supabase.key")
+os.environ.setdefault("RATE_LIMIT_REQUESTS", "1000000000")
+os.environ.setdefault("RATE_LIMIT_CATALOG_REQUESTS", "1000000000")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase, seed_catalog  # noqa: E402
+
+
+async def measure(size: int, iterations: int) -> dict:
+    fake = seed_catalog(FakeSupabase(), products=size)
+    main.supabase = fake
+    transport = httpx.ASGITransport(app=main.app)
+
+    # Time spent inside the fake (filtering, embedding) is not the app's cost
+    upstream = {"total": 0.0}
+    original_execute = type(fake.table("products")).execute
+
+    def timed_execute(query):
+        start = time.perf_counter()
+        try:
+            return original_execute(query)
+        finally:
+            upstream["total"] += time.perf_counter() - start
+
+    type(fake.table("products")).execute = timed_execute
+    samples = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            url = f"/api/products?limit={size}"
+            await client.get(url)
+            for _ in range(iterations):
+                upstream["total"] = 0.0
+                start = time.perf_counter()
+                response = await client.get(url)
+                samples.append((time.perf_counter() - start - upstream["total"]) * 1000)
+                assert response.status_code == 200 and len(response.json()) == size
+    finally:
+        type(fake.table("products")).execute = original_execute
+
+    return {
+        "products": size,
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(statistics.median(samples), 3),
+        "bytes": len(response.content),
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    for size in args.sizes:
+        print(asyncio.run(measure(size, args.iterations)))
+
+
+if __name__ == "__main__":
+    main_cli()
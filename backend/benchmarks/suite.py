@@ -0,0 +1,250 @@
+"""End-to-end benchmark suite: per-endpoint throughput and latency percentiles.
+
+Each catalog size runs in its own process against a freshly seeded
+FakeSupabase (startup, index loading and background tasks included), and
+every scenario is driven concurrently through the ASGI app. Results are
+written as JSON so two runs can be compared:
+
+    cd backend
+    python -m benchmarks.suite --sizes 1000 10000 100000 --output bench.json
+    python -m benchmarks.suite --sizes 1000 --output new.json --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SCENARIOS = [
+    "products_list",
+    "products_filtered",
+    "products_search",
+    "product_detail",
+    "products_batch",
+    "suggestions",
+    "popular",
+    "brands",
+    "cart_quote",
+    "create_order",
+    "orders_admin",
+    "admin_stats",
+]
+
+
+def build_request(name: str, rng: random.Random, products: int, parts: list) -> tuple:
+    # (method, url, json body or None, needs admin token)
+    product_id = rng.randint(1, products)
+    if name == "products_list":
+        return "GET", "/api/products?limit=50", None, False
+    if name == "products_filtered":
+        return "GET", f"/api/products?category_id={rng.randint(1, 8)}&sort_by=price_asc&limit=50", None, False
+    if name == "products_search":
+        return "GET", f"/api/products?search={rng.choice(parts)}&limit=50", None, False
+    if name == "product_detail":
+        return "GET", f"/api/products/{product_id}", None, False
+    if name == "products_batch":
+        ids = ",".join(str(rng.randint(1, products)) for _ in range(20))
+        return "GET", f"/api/products/batch?ids={ids}", None, False
+    if name == "suggestions":
+        return "GET", f"/api/search/suggestions?q={rng.choice(parts)[:3]}", None, False
+    if name == "popular":
+        return "GET", "/api/search/popular", None, False
+    if name == "brands":
+        return "GET", "/api/brands", None, False
+    items = [{"product_id": rng.randint(1, products), "quantity": 1} for _ in range(3)]
+    if name == "cart_quote":
+        return "POST", "/api/cart/quote", {"items": items}, False
+    if name == "create_order":
+        return "POST", "/api/orders", {
+            "customer_name": "Bench Customer",
+            "customer_email": "bench@example.com",
+            "customer_phone": "01000000000",
+            "items": items,
+        }, False
+    if name == "orders_admin":
+        return "GET", "/api/orders?limit=50", None, True
+    if name == "admin_stats":
+        return "GET", "/api/admin/stats", None, True
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(client, name: str, args: argparse.Namespace, parts: list, headers: dict) -> dict:
+    rng = random.Random(f"{args.seed}:{name}")
+    requests = [build_request(name, rng, args.products, parts) for _ in range(args.requests)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def send(method: str, url: str, body, admin: bool) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, url, json=body, headers=headers if admin else None)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(*request) for request in requests))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(requests),
+        "errors": errors,
+        "throughput_rps": round(len(requests) / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p90_ms": round(percentile(latencies, 90), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(max(latencies), 2),
+    }
+
+
+async def run_size(args: argparse.Namespace) -> dict:
+    import httpx
+
+    import main
+    from benchmarks.fake_supabase import PARTS, FakeSupabase, issue_token, seed_catalog
+
+    start = time.perf_counter()
+    main.supabase = seed_catalog(FakeSupabase(args.latency), products=args.products, orders=args.orders)
+    seed_s = time.perf_counter() - start
+    headers = {"Authorization": f"Bearer {issue_token('admin', 'admin@example.com')}"}
+
+    result = {"products": args.products, "orders": args.orders, "seed_s": round(seed_s, 2), "scenarios": {}}
+    start = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        result["startup_s"] = round(time.perf_counter() - start, 2)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Order stats are rebuilt by a background task; measure once warm
+            while True:
+                caches = (await client.get("/api/ready")).json()["caches"]
+                if caches["search_index"]["ready"] and caches["order_stats"]["ready"]:
+                    break
+                await asyncio.sleep(0.1)
+            result["warmup_s"] = round(time.perf_counter() - start, 2)
+
+            for name in args.scenarios:
+                result["scenarios"][name] = await run_scenario(client, name, args, PARTS, headers)
+                print(f"  {args.products:>7} {name:<18} {result['scenarios'][name]}", file=sys.stderr)
+    return result
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    # Settings are read at import time, so the environment is set up first
+    os.environ.setdefault("SUPABASE_URL", "https://fake.supabase.co")
+    os.environ.setdefault("SUPABASE_KEY", "fake.supabase.key")
+    for name in ("RATE_LIMIT_REQUESTS", "RATE_LIMIT_CATALOG_REQUESTS", "RATE_LIMIT_CHECKOUT_REQUESTS"):
+        os.environ.setdefault(name, "1000000000")
+    os.environ.setdefault("SLOW_REQUEST_MS", "1000000")
+    from benchmarks.fake_supabase import FAKE_JWT_SECRET
+    os.environ.setdefault("SUPABASE_JWT_SECRET", FAKE_JWT_SECRET)
+
+    import logging
+    logging.disable(logging.WARNING)
+    print(json.dumps(asyncio.run(run_size(args))))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(current: dict, baseline: dict) -> None:
+    base = {run["products"]: run["scenarios"] for run in baseline["results"]}
+    for run in current["results"]:
+        previous = base.get(run["products"])
+        if previous is None:
+            continue
+        print(f"\n{run['products']} products (vs {baseline['meta'].get('commit') or 'baseline'})")
+        print(f"  {'scenario':<18} {'rps':>10} {'delta':>8} {'p95 ms':>10} {'delta':>8}")
+        for name, stats in run["scenarios"].items():
+            old = previous.get(name)
+            if old is None:
+                continue
+            rps_delta = (stats["throughput_rps"] / old["throughput_rps"] - 1) * 100
+            p95_delta = (stats["p95_ms"] / old["p95_ms"] - 1) * 100 if old["p95_ms"] else 0.0
+            print(
+                f"  {name:<18} {stats['throughput_rps']:>10} {rps_delta:>+7.1f}% "
+                f"{stats['p95_ms']:>10} {p95_delta:>+7.1f}%"
+            )
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--orders-ratio", type=float, default=0.1, help="Seeded orders per product")
+    parser.add_argument("--latency", type=float, default=0.005, help="Injected upstream latency in seconds")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--products", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--orders", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = []
+    for size in args.sizes:
+        command = [
+            sys.executable, "-m", "benchmarks.suite", "--worker",
+            "--products", str(size), "--orders", str(int(size * args.orders_ratio)),
+            "--latency", str(args.latency), "--requests", str(args.requests),
+            "--concurrency", str(args.concurrency), "--seed", str(args.seed),
+            "--scenarios", *args.scenarios,
+        ]
+        completed = subprocess.run(command, cwd=BACKEND_DIR, stdout=subprocess.PIPE, text=True, check=True)
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "latency_s": args.latency,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,21 +1,47 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Request
+from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Request, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse, FileResponse
-from pydantic import BaseModel, EmailStr, Field
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, EmailStr, Field, ValidationError
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
 from supabase import create_client, Client
 from fastapi.staticfiles import StaticFiles
+from starlette.routing import Match
 import os
 from dotenv import load_dotenv
 import uuid
+import jwt
+import json
+import orjson
+import base64
+import csv
+import fcntl
+import hashlib
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Derivatives are skipped without Pillow
+    Image = None
 from unidecode import unidecode
 import re
 import logging
-from functools import lru_cache
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from collections import OrderedDict
+from itertools import islice
+import asyncio
+import bisect
+import copy
+import gc
+import heapq
+import io
+import math
+import tempfile
 import time
 
 # Configure logging
@@ -35,11 +61,36 @@ load_dotenv()
 class Settings:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
+    SUPABASE_JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET", "")
+    ROLE_CACHE_TTL: int = int(os.getenv("ROLE_CACHE_TTL", 60))
+    JWKS_REFRESH_INTERVAL: int = int(os.getenv("JWKS_REFRESH_INTERVAL", 300))
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "production")
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", 5 * 1024 * 1024))
     ALLOWED_IMAGE_TYPES: set = {"image/jpeg", "image/png", "image/webp", "image/jpg"}
+    UPLOAD_CONCURRENCY: int = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+    IMAGE_WORKERS: int = int(os.getenv("IMAGE_WORKERS", 2))
+    UPLOAD_INDEX_SIZE: int = int(os.getenv("UPLOAD_INDEX_SIZE", 10000))
     RATE_LIMIT_REQUESTS: int = int(os.getenv("RATE_LIMIT_REQUESTS", 100))
     RATE_LIMIT_WINDOW: int = int(os.getenv("RATE_LIMIT_WINDOW", 60))
+    RATE_LIMIT_CATALOG_REQUESTS: int = int(os.getenv("RATE_LIMIT_CATALOG_REQUESTS", 300))
+    RATE_LIMIT_AUTH_REQUESTS: int = int(os.getenv("RATE_LIMIT_AUTH_REQUESTS", 10))
+    RATE_LIMIT_CHECKOUT_REQUESTS: int = int(os.getenv("RATE_LIMIT_CHECKOUT_REQUESTS", 10))
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    CATALOG_CACHE_TTL: int = int(os.getenv("CATALOG_CACHE_TTL", 300))
+    CATALOG_CACHE_SIZE: int = int(os.getenv("CATALOG_CACHE_SIZE", 256))
+    CATALOG_REFRESH_INTERVAL: int = int(os.getenv("CATALOG_REFRESH_INTERVAL", 600))
+    CATALOG_MAX_AGE: int = int(os.getenv("CATALOG_MAX_AGE", 60))
+    ADMIN_STATS_INTERVAL: int = int(os.getenv("ADMIN_STATS_INTERVAL", 900))
+    LOW_STOCK_THRESHOLD: int = int(os.getenv("LOW_STOCK_THRESHOLD", 5))
+    MAX_IMPORT_SIZE: int = int(os.getenv("MAX_IMPORT_SIZE", 50 * 1024 * 1024))
+    HEALTH_PROBE_INTERVAL: int = int(os.getenv("HEALTH_PROBE_INTERVAL", 15))
+    HEALTH_PROBE_TIMEOUT: float = float(os.getenv("HEALTH_PROBE_TIMEOUT", 5))
+    HEALTH_MAX_FAILURES: int = int(os.getenv("HEALTH_MAX_FAILURES", 3))
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+    SLOW_REQUEST_MS: float = float(os.getenv("SLOW_REQUEST_MS", 500))
+    REPEATED_QUERY_WARN: int = int(os.getenv("REPEATED_QUERY_WARN", 10))
+    CATALOG_SYNC_FILE: str = os.getenv("CATALOG_SYNC_FILE", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 32))
     
     def __init__(self):
         if not self.SUPABASE_URL or not self.SUPABASE_KEY:
@@ -49,8 +100,308 @@ class Settings:
 
 settings = Settings()
 
-# Rate limiting storage
-rate_limit_storage: Dict[str, List[float]] = {}
+# Rate limiting
+# Sliding window counter: the previous window's count is weighted by how
+# much of it still overlaps the sliding window, so each client costs O(1)
+class MemoryRateLimitStore:
+    def __init__(self):
+        self._counters: Dict[str, list] = {}
+        self._last_sweep = time.time()
+    
+    async def hit(self, key: str, limit: int, window: int) -> bool:
+        now = time.time()
+        current = int(now // window)
+        entry = self._counters.get(key)
+        if entry is None or entry[0] < current - 1:
+            entry = [current, 0, 0]
+        elif entry[0] == current - 1:
+            entry = [current, entry[2], 0]
+        self._counters[key] = entry
+        self._sweep(now, window)
+        
+        weight = 1 - (now % window) / window
+        if entry[1] * weight + entry[2] >= limit:
+            return False
+        entry[2] += 1
+        return True
+    
+    def _sweep(self, now: float, window: int) -> None:
+        # Evict clients idle for more than a full window
+        if now - self._last_sweep < window:
+            return
+        self._last_sweep = now
+        oldest = int(now // window) - 1
+        for key in [k for k, entry in self._counters.items() if entry[0] < oldest]:
+            del self._counters[key]
+    
+    def __len__(self) -> int:
+        return len(self._counters)
+
+class RedisRateLimitStore:
+    # Shared across workers; keys expire on their own so no sweep is needed
+    SCRIPT = """
+    local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+    local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if previous * tonumber(ARGV[1]) + current >= tonumber(ARGV[2]) then
+        return 0
+    end
+    redis.call('INCR', KEYS[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+    """
+    
+    def __init__(self, url: str):
+        import redis.asyncio as aioredis
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(self.SCRIPT)
+    
+    async def hit(self, key: str, limit: int, window: int) -> bool:
+        now = time.time()
+        current = int(now // window)
+        weight = 1 - (now % window) / window
+        try:
+            allowed = await self._script(
+                keys=[f"ratelimit:{key}:{current}", f"ratelimit:{key}:{current - 1}"],
+                args=[weight, limit, window * 2]
+            )
+            return bool(allowed)
+        except Exception as e:
+            logger.warning(f"Rate limit store unavailable: {str(e)}")
+            return True
+
+RATE_LIMIT_CLASSES = {
+    "catalog": settings.RATE_LIMIT_CATALOG_REQUESTS,
+    "auth": settings.RATE_LIMIT_AUTH_REQUESTS,
+    "checkout": settings.RATE_LIMIT_CHECKOUT_REQUESTS,
+    "default": settings.RATE_LIMIT_REQUESTS,
+}
+
+CATALOG_PATHS = ("/api/brands", "/api/models", "/api/categories", "/api/products", "/api/search")
+
+def rate_limit_class(method: str, path: str) -> str:
+    if path in ("/api/auth/login", "/api/auth/register"):
+        return "auth"
+    if method == "POST" and path == "/api/orders":
+        return "checkout"
+    if method == "GET" and path.startswith(CATALOG_PATHS):
+        return "catalog"
+    return "default"
+
+rate_limit_store = RedisRateLimitStore(settings.REDIS_URL) if settings.REDIS_URL else MemoryRateLimitStore()
+
+# Catalog cache
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._cleared = 0
+    
+    def get(self, key) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key, value) -> None:
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def discard(self, key) -> None:
+        self._data.pop(key, None)
+    
+    def invalidate(self, table: str) -> None:
+        # Keys are tuples whose first element is the source table
+        for key in [k for k in self._data if k[0] == table]:
+            del self._data[key]
+        self._generations[table] = self._generations.get(table, 0) + 1
+    
+    def clear(self) -> None:
+        self._data.clear()
+        self._cleared += 1
+    
+    def generation(self, table: str) -> tuple:
+        # Changes whenever the table's entries are dropped, so a read that
+        # overlapped a write can tell its result may already be stale
+        return (self._cleared, self._generations.get(table, 0))
+    
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+catalog_cache = TTLCache(settings.CATALOG_CACHE_SIZE, settings.CATALOG_CACHE_TTL)
+
+class SyncJournal:
+    # Shared by the workers of one server. Each event is one JSON line
+    # written with a single O_APPEND write under an exclusive lock; a worker
+    # reads the lines added since its last look (one stat call when there
+    # are none) and applies the ones written by the other workers, since its
+    # own were applied when they happened.
+    #
+    # A journal starts with a header line holding a random id and its
+    # generation. Once it passes MAX_SIZE the writer holding the lock
+    # renames the next generation into place; readers keep the old file
+    # open, finish it and move on, and later writers see the new inode and
+    # append there instead. A reader that slept through a whole generation
+    # has lost events and falls back to a full resync
+    MAX_SIZE = 1024 * 1024
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.pid = os.getpid()
+        self.mtime = 0.0
+        self._open(at_end=True)
+    
+    def _create(self, generation: int = 0) -> None:
+        tmp = f"{self.path}.{self.pid}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps({"journal": uuid.uuid4().hex[:8], "generation": generation}) + b"\n")
+        os.replace(tmp, self.path)
+    
+    def _open(self, at_end: bool) -> None:
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            self._create()
+            f = open(self.path, "rb")
+        header = orjson.loads(f.readline())
+        self.journal_id, self.generation = header["journal"], header["generation"]
+        stat = os.fstat(f.fileno())
+        self._file, self._inode = f, stat.st_ino
+        self.offset = stat.st_size if at_end else f.tell()
+        self.mtime = max(self.mtime, stat.st_mtime)
+    
+    def publish(self, event: dict) -> None:
+        line = orjson.dumps({"pid": self.pid, **event}) + b"\n"
+        while True:
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            except FileNotFoundError:
+                self._create()
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                # Rotated while waiting for the lock: append to the new file
+                try:
+                    if os.fstat(fd).st_ino != os.stat(self.path).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue
+                os.write(fd, line)
+                if os.fstat(fd).st_size > self.MAX_SIZE:
+                    with open(self.path, "rb") as f:
+                        generation = orjson.loads(f.readline())["generation"]
+                    self._create(generation + 1)
+                return
+            finally:
+                os.close(fd)
+    
+    def _read(self, apply) -> None:
+        self._file.seek(self.offset)
+        data = self._file.read()
+        # A line still being written is picked up on the next poll
+        end = data.rfind(b"\n") + 1
+        self.offset += end
+        for line in data[:end].splitlines():
+            try:
+                event = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                logger.warning(f"Skipping malformed sync event in {self.path}")
+                continue
+            if event.get("pid", self.pid) != self.pid:
+                apply(event)
+    
+    def poll(self, apply, resync) -> None:
+        while True:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if stat.st_ino == self._inode:
+                if stat.st_size > self.offset:
+                    self._read(apply)
+                    self.mtime = max(self.mtime, stat.st_mtime)
+                return
+            # Rotated: nothing is appended to the old file any more
+            self._read(apply)
+            self._file.close()
+            generation = self.generation
+            self._open(at_end=False)
+            if self.generation != generation + 1:
+                logger.warning(f"Missed a generation of {self.path}, resyncing")
+                resync()
+    
+    def skip(self) -> None:
+        self.poll(lambda event: None, lambda: None)
+
+catalog_sync = SyncJournal(settings.CATALOG_SYNC_FILE) if settings.CATALOG_SYNC_FILE else None
+order_sync = SyncJournal(f"{settings.CATALOG_SYNC_FILE}.orders") if settings.CATALOG_SYNC_FILE else None
+
+class CatalogVersion:
+    # Bumped on every catalog write. The boot id keeps ETags from two
+    # processes that happen to share a counter value from ever matching.
+    # With several workers the validators come from the shared journal
+    # instead, so every worker answers with the same ETag for the same
+    # catalog; the journal id plays the boot id's part and the refresh
+    # epoch takes the place of the periodic bump
+    def __init__(self):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._modified = int(time.time())
+    
+    def bump(self) -> None:
+        self.version += 1
+        # Whole seconds, strictly increasing, so Last-Modified is exact
+        self._modified = max(int(time.time()), self._modified + 1)
+    
+    @staticmethod
+    def _epoch() -> int:
+        return int(time.time()) // settings.CATALOG_REFRESH_INTERVAL
+    
+    @property
+    def etag(self) -> str:
+        if catalog_sync is not None:
+            return f'W/"{catalog_sync.journal_id}-{catalog_sync.offset}-{self._epoch()}"'
+        return f'W/"{self.boot_id}-{self.version}"'
+    
+    @property
+    def modified(self) -> int:
+        if catalog_sync is not None:
+            return max(math.ceil(catalog_sync.mtime), self._epoch() * settings.CATALOG_REFRESH_INTERVAL)
+        return self._modified
+
+catalog_version = CatalogVersion()
+
+def invalidate_catalog(*tables: str, products: List[int] = (), related: Optional[tuple] = None) -> None:
+    # products and related name the index work the other workers have to
+    # repeat; the caller has already done it here
+    for table in tables:
+        catalog_cache.invalidate(table)
+    catalog_version.bump()
+    if catalog_sync is not None:
+        catalog_sync.publish({"tables": tables, "products": list(products), "related": related})
 
 # Lifespan
 @asynccontextmanager
@@ -58,7 +409,26 @@ async def lifespan(app: FastAPI):
     logger.info("🚀 Starting Auto Parts API...")
     logger.info(f"Environment: {settings.ENVIRONMENT}")
     logger.info(f"Port: {os.getenv('PORT', '8000')}")
+    # Warm-up runs before the worker accepts traffic, so its first requests
+    # are served from loaded indexes and caches
+    try:
+        await refresh_catalog_indexes()
+        await warm_catalog_cache()
+    except Exception as e:
+        logger.error(f"Search index load failed: {str(e)}")
+    refresh_task = asyncio.create_task(catalog_refresh_loop())
+    stats_task = asyncio.create_task(order_stats_loop())
+    probe_task = asyncio.create_task(upstream_probe_loop())
     yield
+    # Imports still running are stopped and recorded as interrupted
+    for task in import_tasks:
+        task.cancel()
+    await asyncio.gather(*import_tasks, return_exceptions=True)
+    refresh_task.cancel()
+    stats_task.cancel()
+    probe_task.cancel()
+    db_executor.shutdown(wait=False)
+    image_executor.shutdown(wait=False)
     logger.info("👋 Shutting down Auto Parts API...")
 
 app = FastAPI(
@@ -66,6 +436,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -106,35 +477,351 @@ def get_supabase_client() -> Client:
 supabase = get_supabase_client()
 security = HTTPBearer()
 
+# Metrics
+# Plain dicts of counters updated on the event loop; histograms keep
+# per-bucket counts and are only made cumulative when /metrics is scraped
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    def __init__(self):
+        self.series: Dict[tuple, list] = {}
+    
+    def observe(self, labels: tuple, seconds: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            # Bucket counts, then +Inf, then the sum
+            series = self.series[labels] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        series[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        series[-1] += seconds
+    
+    def render(self, name: str, label_names: tuple) -> List[str]:
+        lines = []
+        for labels, series in sorted(self.series.items()):
+            base = metric_labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{name}_count{{{base}}} {cumulative}")
+        return lines
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def metric_labels(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+
+class Metrics:
+    def __init__(self):
+        self.requests = Histogram()
+        self.upstream = Histogram()
+        self.in_flight = 0
+        self.rate_limited: Dict[str, int] = {}
+        self.unhandled_errors = 0
+        self.upstream_reads = 0
+        self.coalesced_reads = 0
+    
+    def render(self) -> str:
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route template and status",
+            "# TYPE http_request_duration_seconds histogram",
+            *self.requests.render("http_request_duration_seconds", ("method", "route", "status")),
+            "# HELP http_requests_in_flight Requests currently being served",
+            "# TYPE http_requests_in_flight gauge",
+            f"http_requests_in_flight {self.in_flight}",
+            "# HELP http_rate_limited_total Requests rejected with 429 by limit class",
+            "# TYPE http_rate_limited_total counter",
+            *(f'http_rate_limited_total{{class="{name}"}} {count}' for name, count in sorted(self.rate_limited.items())),
+            "# HELP http_unhandled_exceptions_total Exceptions that reached the global handler",
+            "# TYPE http_unhandled_exceptions_total counter",
+            f"http_unhandled_exceptions_total {self.unhandled_errors}",
+            "# HELP supabase_request_duration_seconds PostgREST call latency by table and method",
+            "# TYPE supabase_request_duration_seconds histogram",
+            *self.upstream.render("supabase_request_duration_seconds", ("table", "method")),
+            "# HELP supabase_reads_total Reads sent upstream",
+            "# TYPE supabase_reads_total counter",
+            f"supabase_reads_total {self.upstream_reads}",
+            "# HELP supabase_coalesced_reads_total Reads served by joining an identical in-flight read",
+            "# TYPE supabase_coalesced_reads_total counter",
+            f"supabase_coalesced_reads_total {self.coalesced_reads}",
+        ]
+        
+        caches = {"catalog": catalog_cache.stats(), "roles": role_cache.stats(), "uploads": upload_index.stats()}
+        for name, kind in (("hits", "counter"), ("misses", "counter"), ("size", "gauge"), ("hit_ratio", "gauge")):
+            metric = f"cache_{name}_total" if kind == "counter" else f"cache_{name}"
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(f'{metric}{{cache="{cache}"}} {stats[name]}' for cache, stats in caches.items())
+        
+        lines += [
+            "# TYPE supabase_probe_latency_seconds gauge",
+            f"supabase_probe_latency_seconds {(upstream_probe.last_latency_ms or 0) / 1000}",
+            "# TYPE supabase_probe_consecutive_failures gauge",
+            f"supabase_probe_consecutive_failures {upstream_probe.consecutive_failures}",
+            "# TYPE search_index_products gauge",
+            f"search_index_products {len(search_index.products)}",
+        ]
+        worker = os.getpid()
+        return "\n".join(self._with_worker(line, worker) for line in lines) + "\n"
+    
+    @staticmethod
+    def _with_worker(line: str, worker: int) -> str:
+        # Each worker keeps its own counters and a scrape reaches only one,
+        # so every series names its worker; a recycled worker starts new
+        # series instead of looking like a counter reset
+        if line.startswith("#"):
+            return line
+        name, brace, rest = line.partition("{")
+        if brace:
+            return f'{name}{{worker="{worker}",{rest}'
+        name, _, value = line.partition(" ")
+        return f'{name}{{worker="{worker}"}} {value}'
+
+metrics = Metrics()
+
+def route_template(request: Request) -> str:
+    # FastAPI records the matched route in the scope; responses produced
+    # before routing (429, 304) are matched here instead. Unknown paths
+    # share one label so scanners cannot blow up the series count
+    route = request.scope.get("route")
+    if route is None:
+        for candidate in request.app.router.routes:
+            if candidate.matches(request.scope)[0] == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
+
+# Tracing
+# Each request carries a trace in a context variable; db_execute appends
+# every PostgREST call to it. Tasks spawned by the request inherit the
+# same trace, so concurrent (gathered) calls are counted too
+MAX_TRACED_QUERIES = 200
+
+class RequestTrace:
+    def __init__(self):
+        self.count = 0
+        self.upstream = 0.0
+        self.queries: List[tuple] = []
+    
+    def record(self, query, seconds: float) -> None:
+        self.count += 1
+        self.upstream += seconds
+        if len(self.queries) < MAX_TRACED_QUERIES:
+            self.queries.append((query.path.lstrip("/"), query.http_method, str(query.params), seconds))
+    
+    def repeated(self) -> List[tuple]:
+        # (table, method) pairs issued often enough to look like an N+1 loop
+        counts: Dict[tuple, int] = {}
+        for table, method, _, _ in self.queries:
+            counts[(table, method)] = counts.get((table, method), 0) + 1
+        return [(key, count) for key, count in counts.items() if count >= settings.REPEATED_QUERY_WARN]
+
+request_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+# Data access
+db_executor = ThreadPoolExecutor(max_workers=settings.DB_POOL_SIZE, thread_name_prefix="supabase")
+
+async def run_blocking(func, *args, **kwargs):
+    # The supabase client is synchronous; its calls run on a bounded pool
+    # so a slow upstream never stalls the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+async def execute_query(query):
+    start = time.perf_counter()
+    try:
+        return await run_blocking(query.execute)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.upstream.observe((query.path.lstrip("/"), query.http_method), elapsed)
+        trace = request_trace.get()
+        if trace is not None:
+            trace.record(query, elapsed)
+
+def share_result(result):
+    # Waiters on a shared read each get their own row dicts, since handlers
+    # format rows in place; embedded relations are only ever read
+    shared = copy.copy(result)
+    if isinstance(result.data, list):
+        shared.data = [dict(row) if isinstance(row, dict) else row for row in result.data]
+    return shared
+
+class SingleFlight:
+    # Identical reads issued while one is already in flight wait for it
+    # instead of going upstream again. The shared call runs as its own task,
+    # so a waiter that is cancelled (client gone) never cancels the others.
+    # Every write moves to a new generation, so a read issued after a write
+    # never joins one that may have started before it
+    def __init__(self):
+        self.inflight: Dict[tuple, list] = {}
+        self.generation = 0
+    
+    def _done(self, key: tuple, entry: list, task: asyncio.Task) -> None:
+        if self.inflight.get(key) is entry:
+            del self.inflight[key]
+        if not task.cancelled():
+            task.exception()
+    
+    async def run(self, key: tuple, query):
+        key = (self.generation, *key)
+        entry = self.inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(execute_query(query))
+            entry = self.inflight[key] = [task, 0]
+            task.add_done_callback(partial(self._done, key, entry))
+            metrics.upstream_reads += 1
+        else:
+            metrics.coalesced_reads += 1
+        entry[1] += 1
+        
+        result = await asyncio.shield(entry[0])
+        return share_result(result) if entry[1] > 1 else result
+
+single_flight = SingleFlight()
+
+async def db_execute(query):
+    if query.http_method != "GET":
+        single_flight.generation += 1
+        try:
+            return await execute_query(query)
+        finally:
+            single_flight.generation += 1
+    return await single_flight.run((query.path, str(query.params), query.headers.get("prefer")), query)
+
+async def cached_query(key: tuple, query, transform=None) -> Response:
+    # Catalog payloads are cached already serialized, so a hit is a memcpy
+    payload = catalog_cache.get(key)
+    if payload is None:
+        generation = catalog_cache.generation(key[0])
+        rows = (await db_execute(query)).data
+        payload = orjson.dumps(transform(rows) if transform else rows)
+        # Not stored if the table was written while the query was running
+        if catalog_cache.generation(key[0]) == generation:
+            catalog_cache.set(key, payload)
+    return Response(content=payload, media_type="application/json")
+
+# Conditional requests
+CONDITIONAL_PATHS = re.compile(r"^/api/(brands|models|categories|products)(/\d+(/models)?|/batch)?$")
+
+def catalog_validators() -> dict:
+    return {
+        "ETag": catalog_version.etag,
+        "Last-Modified": formatdate(catalog_version.modified, usegmt=True),
+        "Cache-Control": f"public, max-age={settings.CATALOG_MAX_AGE}, must-revalidate",
+    }
+
+def is_not_modified(request: Request, any_exists: bool) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence; weak comparison ignores W/
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return (any_exists and "*" in tags) or catalog_version.etag.removeprefix("W/") in tags
+    
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return catalog_version.modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+# Registered before the rate limiter, which then runs first, so a 304
+# costs a client the same as any other request
+@app.middleware("http")
+async def conditional_cache_middleware(request: Request, call_next):
+    if request.method != "GET":
+        return await call_next(request)
+    # Catalog writes and orders from other workers are applied before any read
+    if catalog_sync is not None:
+        catalog_sync.poll(apply_catalog_event, resync_catalog)
+        order_sync.poll(apply_order_event, resync_order_stats)
+    match = CONDITIONAL_PATHS.match(request.url.path)
+    if not match:
+        return await call_next(request)
+    
+    # A path naming an id may not exist, so "*" is only answered with a
+    # 304 once the handler has found it
+    by_id = match.group(2) not in (None, "/batch")
+    validators = catalog_validators()
+    if is_not_modified(request, any_exists=not by_id):
+        return Response(status_code=304, headers=validators)
+    
+    response = await call_next(request)
+    if response.status_code == 200:
+        if by_id and is_not_modified(request, any_exists=True):
+            return Response(status_code=304, headers=validators)
+        response.headers.update(validators)
+    return response
+
 # Rate Limiting
 @app.middleware("http")
 async def rate_limit_middleware(request: Request, call_next):
     if request.url.path.startswith("/api/"):
         client_ip = request.client.host
-        current_time = time.time()
-        
-        if client_ip in rate_limit_storage:
-            rate_limit_storage[client_ip] = [
-                req_time for req_time in rate_limit_storage[client_ip]
-                if current_time - req_time < settings.RATE_LIMIT_WINDOW
-            ]
-        else:
-            rate_limit_storage[client_ip] = []
+        limit_class = rate_limit_class(request.method, request.url.path)
         
-        if len(rate_limit_storage[client_ip]) >= settings.RATE_LIMIT_REQUESTS:
+        allowed = await rate_limit_store.hit(
+            f"{limit_class}:{client_ip}",
+            RATE_LIMIT_CLASSES[limit_class],
+            settings.RATE_LIMIT_WINDOW
+        )
+        if not allowed:
+            metrics.rate_limited[limit_class] = metrics.rate_limited.get(limit_class, 0) + 1
             return JSONResponse(
                 status_code=429,
-                content={"detail": "Too many requests"}
+                content={"detail": "Too many requests"},
+                headers={"Retry-After": str(settings.RATE_LIMIT_WINDOW)}
             )
-        
-        rate_limit_storage[client_ip].append(current_time)
     
     response = await call_next(request)
     return response
 
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    trace = RequestTrace()
+    request_trace.set(trace)
+    start = time.perf_counter()
+    response = await call_next(request)
+    total_ms = (time.perf_counter() - start) * 1000
+    
+    response.headers["Server-Timing"] = (
+        f'db;desc="{trace.count} queries";dur={trace.upstream * 1000:.1f}, total;dur={total_ms:.1f}'
+    )
+    
+    repeated = trace.repeated()
+    if total_ms >= settings.SLOW_REQUEST_MS or repeated:
+        reason = "Slow request" if total_ms >= settings.SLOW_REQUEST_MS else "Repeated queries"
+        logger.warning(
+            f"{reason}: {request.method} {request.url.path} {total_ms:.0f}ms, "
+            f"{trace.count} queries, {trace.upstream * 1000:.0f}ms upstream"
+        )
+        for (table, method), count in repeated:
+            logger.warning(f"  {count}x {method} {table} in one request")
+        for table, method, params, seconds in sorted(trace.queries, key=lambda q: q[3], reverse=True)[:5]:
+            logger.warning(f"  {seconds * 1000:.0f}ms {method} {table} {params[:200]}")
+    return response
+
+# Registered last so it wraps the other middlewares and sees their 429s and 304s
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    metrics.in_flight += 1
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.in_flight -= 1
+        metrics.requests.observe(
+            (request.method, route_template(request), status_code),
+            time.perf_counter() - start
+        )
+
 # Exception Handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
+    metrics.unhandled_errors += 1
     logger.error(f"Error: {str(exc)}", exc_info=True)
     return JSONResponse(
         status_code=500,
@@ -175,10 +862,23 @@ class Product(BaseModel):
     stock_quantity: int = Field(..., ge=0)
     description: Optional[str] = Field(None, max_length=2000)
 
+class ProductPatch(BaseModel):
+    id: int = Field(..., gt=0)
+    price: Optional[float] = Field(None, gt=0)
+    stock_quantity: Optional[int] = Field(None, ge=0)
+    price_delta: Optional[float] = None
+    stock_delta: Optional[int] = None
+
+class BulkProductPatch(BaseModel):
+    items: List[ProductPatch] = Field(..., min_length=1, max_length=500)
+
 class CartItem(BaseModel):
     product_id: int = Field(..., gt=0)
     quantity: int = Field(..., gt=0, le=100)
 
+class CartQuote(BaseModel):
+    items: List[CartItem] = Field(..., min_length=1, max_length=50)
+
 class OrderCreate(BaseModel):
     customer_name: str = Field(..., min_length=2, max_length=100)
     customer_email: EmailStr
@@ -190,24 +890,52 @@ class User(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=8, max_length=100)
 
+class AuthenticatedUser(BaseModel):
+    id: str
+    email: Optional[str] = None
+    role: str = "customer"
+
 # Validation
-def validate_file_size(file: UploadFile) -> None:
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    
-    if file_size > settings.MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large (max {settings.MAX_FILE_SIZE / 1024 / 1024}MB)"
-        )
+UPLOAD_CHUNK_SIZE = 64 * 1024
 
-def validate_file_type(file: UploadFile) -> None:
-    if file.content_type not in settings.ALLOWED_IMAGE_TYPES:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid file type"
-        )
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", "png"),
+)
+
+async def read_upload(file: UploadFile) -> bytes:
+    # Read in chunks so an oversized file is rejected as soon as it
+    # crosses the limit instead of after it is fully in memory
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"File too large (max {settings.MAX_FILE_SIZE / 1024 / 1024}MB)"
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def sniff_image_type(content: bytes) -> tuple:
+    # The declared content_type is client input; trust the magic bytes
+    detected = None
+    for signature, content_type, ext in IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            detected = (content_type, ext)
+            break
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        detected = ("image/webp", "webp")
+    if detected and detected[0] in settings.ALLOWED_IMAGE_TYPES:
+        return detected
+    raise HTTPException(
+        status_code=400,
+        detail="Invalid file type"
+    )
 
 # Search helpers
 @lru_cache(maxsize=1000)
@@ -219,80 +947,1015 @@ def normalize_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-def calculate_relevance_score(product: dict, search_terms: list) -> int:
+PRODUCT_SELECT = """
+    *,
+    categories(id, name),
+    car_brands(id, name, logo_url),
+    car_models(id, name)
+"""
+
+def format_product(product: dict) -> dict:
+    # Flattens the embedded relations in place; rows come fresh from
+    # PostgREST so there is nothing to copy
+    category = product.get('categories')
+    brand = product.get('car_brands')
+    model = product.get('car_models')
+    product['category_name'] = category.get('name') if category else None
+    product['brand_name'] = brand.get('name') if brand else None
+    product['brand_logo'] = brand.get('logo_url') if brand else None
+    product['model_name'] = model.get('name') if model else None
+    product['image_variants'] = image_variants(product.get('image_url'))
+    return product
+
+def search_fields(product: dict) -> tuple:
+    return (
+        normalize_text(product.get('name', '')),
+        normalize_text(product.get('description', '')),
+        normalize_text(product['car_brands'].get('name', '')) if product.get('car_brands') else "",
+        normalize_text(product['car_models'].get('name', '')) if product.get('car_models') else "",
+        normalize_text(product['categories'].get('name', '')) if product.get('categories') else "",
+    )
+
+def score_fields(fields: tuple, search_terms: list) -> int:
+    product_name, description, brand_name, model_name, category_name = fields
     score = 0
     
-    product_name = normalize_text(product.get('name', ''))
     for term in search_terms:
         if term in product_name:
             score += 10
             if product_name.startswith(term):
                 score += 5
-    
-    description = normalize_text(product.get('description', ''))
-    for term in search_terms:
         if term in description:
             score += 3
-    
-    if product.get('car_brands'):
-        brand_name = normalize_text(product['car_brands'].get('name', ''))
-        for term in search_terms:
-            if term in brand_name:
-                score += 8
-    
-    if product.get('car_models'):
-        model_name = normalize_text(product['car_models'].get('name', ''))
-        for term in search_terms:
-            if term in model_name:
-                score += 8
-    
-    if product.get('categories'):
-        category_name = normalize_text(product['categories'].get('name', ''))
-        for term in search_terms:
-            if term in category_name:
-                score += 5
+        if term in brand_name:
+            score += 8
+        if term in model_name:
+            score += 8
+        if term in category_name:
+            score += 5
     
     return score
 
+def calculate_relevance_score(product: dict, search_terms: list) -> int:
+    return score_fields(search_fields(product), search_terms)
+
+class SearchIndex:
+    # Terms are matched against the token vocabulary through a trigram
+    # index (tokens shorter than three characters are keyed by themselves),
+    # so a lookup touches only tokens that can contain the term. Per-term scores are additive, so
+    # they are cached per term and kept current on writes instead of being
+    # thrown away
+    GRAM_SIZE = 3
+    TERM_CACHE_SIZE = 256
+    
+    def __init__(self):
+        self.ready = False
+        self.version = 0
+        self.products: Dict[int, dict] = {}
+        self.fields: Dict[int, tuple] = {}
+        self.postings: Dict[str, set] = {}
+        self.grams: Dict[str, set] = {}
+        self.counts: Dict[tuple, int] = {}
+        self.touched: Optional[set] = None
+        self._term_scores: "OrderedDict[str, Dict[int, int]]" = OrderedDict()
+    
+    def add(self, product: dict) -> None:
+        product_id = product["id"]
+        self.remove(product_id)
+        
+        fields = search_fields(product)
+        self.products[product_id] = format_product(product)
+        self.fields[product_id] = fields
+        self._count(product, 1)
+        for token in set(" ".join(fields).split()):
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                for gram in self._grams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+            ids.add(product_id)
+        
+        text = " ".join(fields)
+        for term, scores in self._term_scores.items():
+            if term in text:
+                scores[product_id] = score_fields(fields, [term])
+        self.version += 1
+    
+    def remove(self, product_id: int) -> None:
+        if self.touched is not None:
+            self.touched.add(product_id)
+        fields = self.fields.pop(product_id, None)
+        product = self.products.pop(product_id, None)
+        if fields is None:
+            return
+        
+        self._count(product, -1)
+        for token in set(" ".join(fields).split()):
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self.postings[token]
+                    for gram in self._grams(token):
+                        tokens = self.grams.get(gram)
+                        if tokens is not None:
+                            tokens.discard(token)
+                            if not tokens:
+                                del self.grams[gram]
+        
+        for scores in self._term_scores.values():
+            scores.pop(product_id, None)
+        self.version += 1
+    
+    def load(self, products: List[dict]) -> None:
+        self.products.clear()
+        self.fields.clear()
+        self.postings.clear()
+        self.grams.clear()
+        self.counts.clear()
+        self._term_scores.clear()
+        for product in products:
+            self.add(product)
+        self.ready = True
+    
+    def _grams(self, token: str) -> set:
+        if len(token) < self.GRAM_SIZE:
+            return {token}
+        return {token[i:i + self.GRAM_SIZE] for i in range(len(token) - self.GRAM_SIZE + 1)}
+    
+    def _count(self, product: dict, delta: int) -> None:
+        # Products per brand, model and category, used for popularity ranking
+        for column in ("brand_id", "model_id", "category_id"):
+            if product.get(column):
+                key = (column, product[column])
+                self.counts[key] = self.counts.get(key, 0) + delta
+                if self.counts[key] <= 0:
+                    del self.counts[key]
+    
+    def tokens(self, term: str) -> set:
+        # A shorter term is inside one of the token's trigrams (or is inside
+        # the short token itself), and there are only a few thousand keys
+        if len(term) < self.GRAM_SIZE:
+            tokens = set()
+            for gram, gram_tokens in self.grams.items():
+                if term in gram:
+                    tokens |= gram_tokens
+            return {token for token in tokens if term in token}
+        # Every token holding a longer term holds all of its trigrams; the
+        # rarest ones narrow the set before the exact substring check
+        sets = sorted(
+            (self.grams.get(term[i:i + self.GRAM_SIZE], set()) for i in range(len(term) - self.GRAM_SIZE + 1)),
+            key=len
+        )
+        tokens = set(sets[0])
+        for other in sets[1:]:
+            tokens &= other
+            if not tokens:
+                break
+        return {token for token in tokens if term in token}
+    
+    def term_scores(self, term: str) -> Dict[int, int]:
+        # Terms never contain whitespace, so a substring match on a field
+        # is always a substring match on one of its tokens
+        scores = self._term_scores.get(term)
+        if scores is not None:
+            self._term_scores.move_to_end(term)
+            return scores
+        
+        ids = set()
+        for token in self.tokens(term):
+            ids |= self.postings[token]
+        scores = {pid: score_fields(self.fields[pid], [term]) for pid in ids}
+        self._term_scores[term] = scores
+        if len(self._term_scores) > self.TERM_CACHE_SIZE:
+            self._term_scores.popitem(last=False)
+        return scores
+    
+    def search(
+        self,
+        search_terms: list,
+        sort_key,
+        reverse: bool = False,
+        offset: int = 0,
+        limit: int = 100,
+        after: Optional[tuple] = None,
+        category_id: Optional[int] = None,
+        brand_id: Optional[int] = None,
+        model_id: Optional[int] = None
+    ) -> tuple:
+        # Returns one page of (score, product) pairs and whether more follow.
+        # Only offset + limit + 1 results are ever ordered, not every match
+        if len(search_terms) == 1:
+            scores = self.term_scores(search_terms[0])
+        else:
+            scores: Dict[int, int] = {}
+            for term in search_terms:
+                for pid, score in self.term_scores(term).items():
+                    scores[pid] = scores.get(pid, 0) + score
+        
+        results = ((score, self.products[pid]) for pid, score in scores.items())
+        if category_id or brand_id or model_id:
+            results = (
+                (score, product) for score, product in results
+                if (not category_id or product.get("category_id") == category_id)
+                and (not brand_id or product.get("brand_id") == brand_id)
+                and (not model_id or product.get("model_id") == model_id)
+            )
+        if after is not None:
+            offset = 0
+            results = (r for r in results if (sort_key(r) < after if reverse else sort_key(r) > after))
+        
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        ranked = select(offset + limit + 1, results, key=sort_key)
+        return ranked[offset:offset + limit], len(ranked) > offset + limit
+
+search_index = SearchIndex()
+
+async def fetch_all_products(batch_size: int = 1000) -> List[dict]:
+    products = []
+    offset = 0
+    while True:
+        batch = (await db_execute(
+            supabase.table("products").select(PRODUCT_SELECT).order("id").range(offset, offset + batch_size - 1)
+        )).data
+        products.extend(batch)
+        if len(batch) < batch_size:
+            break
+        offset += batch_size
+    return products
+
+async def reindex_product(product_id: int) -> None:
+    if not search_index.ready:
+        return
+    result = await db_execute(supabase.table("products").select(PRODUCT_SELECT).eq("id", product_id))
+    if result.data:
+        search_index.add(result.data[0])
+        autocomplete_index.add("product", product_id, result.data[0].get("name"))
+    else:
+        search_index.remove(product_id)
+        autocomplete_index.remove("product", product_id)
+
+async def reindex_products(product_ids: List[int], batch_size: int = 500) -> None:
+    if not search_index.ready:
+        return
+    for i in range(0, len(product_ids), batch_size):
+        chunk = product_ids[i:i + batch_size]
+        result = await db_execute(supabase.table("products").select(PRODUCT_SELECT).in_("id", chunk))
+        fresh = set()
+        for product in result.data:
+            search_index.add(product)
+            autocomplete_index.add("product", product["id"], product.get("name"))
+            fresh.add(product["id"])
+        for product_id in chunk:
+            if product_id not in fresh:
+                search_index.remove(product_id)
+                autocomplete_index.remove("product", product_id)
+
+async def reindex_related_products(column: str, value: int) -> None:
+    # Brand, model and category names are denormalized into the index
+    if not search_index.ready:
+        return
+    # Reloaded by id: after a delete the FK is nulled, so a lookup by the
+    # old column value would miss every affected product
+    stale = [pid for pid, p in search_index.products.items() if p.get(column) == value]
+    await reindex_products(stale)
+
+# Autocomplete
+SUGGESTION_TYPES = {"brand": 0, "model": 1, "category": 2, "product": 3}
+SUGGESTION_COUNT_COLUMNS = {"brand": "brand_id", "model": "model_id", "category": "category_id"}
+
+class AutocompleteIndex:
+    # Sorted table of (suffix, type rank, id) for every word-start suffix of
+    # each normalized name; a prefix query is a bisect plus a range scan
+    MAX_SCAN = 2000
+    
+    def __init__(self):
+        self.ready = False
+        self.version = 0
+        self.names: Dict[tuple, str] = {}
+        self.tables: Dict[str, List[tuple]] = {t: [] for t in SUGGESTION_TYPES}
+        self.touched: Optional[set] = None
+        self._cache: "OrderedDict[str, list]" = OrderedDict()
+    
+    @staticmethod
+    def _suffixes(text: str) -> List[str]:
+        normalized = normalize_text(text)
+        return [normalized[m.start():] for m in re.finditer(r'\S+', normalized)]
+    
+    def add(self, entity_type: str, entity_id: int, text: str) -> None:
+        self.remove(entity_type, entity_id)
+        if not text:
+            return
+        
+        self.names[(entity_type, entity_id)] = text
+        table = self.tables[entity_type]
+        for suffix in self._suffixes(text):
+            bisect.insort(table, (suffix, entity_id))
+        self._changed()
+    
+    def remove(self, entity_type: str, entity_id: int) -> None:
+        if self.touched is not None:
+            self.touched.add((entity_type, entity_id))
+        text = self.names.pop((entity_type, entity_id), None)
+        if text is None:
+            return
+        
+        table = self.tables[entity_type]
+        for suffix in self._suffixes(text):
+            i = bisect.bisect_left(table, (suffix, entity_id))
+            if i < len(table) and table[i] == (suffix, entity_id):
+                del table[i]
+        self._changed()
+    
+    def load(self, entity_type: str, rows: List[dict]) -> None:
+        for key in [k for k in self.names if k[0] == entity_type]:
+            del self.names[key]
+            if self.touched is not None:
+                self.touched.add(key)
+        
+        table = []
+        for row in rows:
+            if row.get("name"):
+                self.names[(entity_type, row["id"])] = row["name"]
+                if self.touched is not None:
+                    self.touched.add((entity_type, row["id"]))
+                table.extend((suffix, row["id"]) for suffix in self._suffixes(row["name"]))
+        table.sort()
+        self.tables[entity_type] = table
+        self._changed()
+    
+    def _changed(self) -> None:
+        self.version += 1
+        self._cache.clear()
+    
+    def lookup(self, entity_type: str, normalized: str) -> Optional[int]:
+        table = self.tables[entity_type]
+        i = bisect.bisect_left(table, (normalized,))
+        if i < len(table) and table[i][0] == normalized:
+            return table[i][1]
+        return None
+    
+    def popularity(self, entity_type: str, entity_id: int) -> int:
+        if entity_type == "product":
+            product = search_index.products.get(entity_id)
+            return (product or {}).get("reviews_count") or 0
+        return search_index.counts.get((SUGGESTION_COUNT_COLUMNS[entity_type], entity_id), 0)
+    
+    def suggest(self, query: str, limit: int = 10) -> List[dict]:
+        normalized_query = normalize_text(query)
+        cached = self._cache.get(normalized_query)
+        if cached is not None:
+            return cached
+        
+        suggestions = []
+        seen = set()
+        for entity_type in SUGGESTION_TYPES:
+            table = self.tables[entity_type]
+            ids = set()
+            i = bisect.bisect_left(table, (normalized_query,))
+            while i < len(table) and len(ids) < self.MAX_SCAN and table[i][0].startswith(normalized_query):
+                ids.add(table[i][1])
+                i += 1
+            
+            for entity_id in heapq.nlargest(limit, ids, key=lambda x: self.popularity(entity_type, x)):
+                text = self.names[(entity_type, entity_id)]
+                if text not in seen:
+                    seen.add(text)
+                    suggestions.append({"text": text, "type": entity_type})
+            if len(suggestions) >= limit:
+                break
+        
+        suggestions = suggestions[:limit]
+        self._cache[normalized_query] = suggestions
+        if len(self._cache) > 1024:
+            self._cache.popitem(last=False)
+        return suggestions
+
+autocomplete_index = AutocompleteIndex()
+
+async def fetch_suggestion_rows(entity_type: str) -> List[dict]:
+    table = {"brand": "car_brands", "model": "car_models", "category": "categories"}[entity_type]
+    return (await db_execute(supabase.table(table).select("id, name"))).data
+
+async def load_autocomplete_table(entity_type: str) -> None:
+    autocomplete_index.load(entity_type, await fetch_suggestion_rows(entity_type))
+
+# Popularity
+class PopularityStats:
+    # Product counts come from the search index; searches and ordered
+    # quantities are recorded per brand and category as traffic arrives.
+    # Ordered quantities are also rebuilt from order_items whenever the
+    # order stats are reconciled, so they survive restarts, and are shared
+    # between workers with the order events. Search counts have no table
+    # behind them: each worker counts the searches it served and starts
+    # over when it is recycled
+    RANKINGS = ("products", "searches", "orders", "activity")
+    
+    def __init__(self):
+        self.version = 0
+        self.searches: Dict[tuple, int] = {}
+        self.orders: Dict[tuple, int] = {}
+        self._ranked: Dict[str, tuple] = {}
+    
+    def record_search(self, query: str) -> None:
+        normalized = normalize_text(query)
+        for entity_type in ("brand", "category"):
+            for text in {normalized, *normalized.split()}:
+                entity_id = autocomplete_index.lookup(entity_type, text)
+                if entity_id is not None:
+                    key = (entity_type, entity_id)
+                    self.searches[key] = self.searches.get(key, 0) + 1
+                    self.version += 1
+                    break
+    
+    @staticmethod
+    def _add_order(orders: Dict[tuple, int], product_id: int, quantity: int) -> None:
+        product = search_index.products.get(product_id)
+        if not product:
+            return
+        for entity_type, column in (("brand", "brand_id"), ("category", "category_id")):
+            if product.get(column):
+                key = (entity_type, product[column])
+                orders[key] = orders.get(key, 0) + quantity
+    
+    def record_order(self, product_id: int, quantity: int) -> None:
+        self._add_order(self.orders, product_id, quantity)
+        self.version += 1
+    
+    def load_orders(self, sold: Dict[int, int]) -> None:
+        orders: Dict[tuple, int] = {}
+        for product_id, quantity in sold.items():
+            self._add_order(orders, product_id, quantity)
+        self.orders = orders
+        self.version += 1
+    
+    def _score(self, rank_by: str, entity_type: str, entity_id: int) -> tuple:
+        key = (entity_type, entity_id)
+        products = autocomplete_index.popularity(entity_type, entity_id)
+        searches = self.searches.get(key, 0)
+        orders = self.orders.get(key, 0)
+        if rank_by == "searches":
+            return (searches, products)
+        if rank_by == "orders":
+            return (orders, products)
+        if rank_by == "activity":
+            return (searches + 3 * orders, products)
+        return (products,)
+    
+    def _top(self, rank_by: str, entity_type: str, limit: int = 5) -> List[str]:
+        ids = [entity_id for (t, entity_id) in autocomplete_index.names if t == entity_type]
+        ranked = [
+            entity_id for entity_id in heapq.nlargest(
+                limit, ids, key=lambda x: self._score(rank_by, entity_type, x)
+            )
+            if self._score(rank_by, entity_type, entity_id)[0] > 0
+        ]
+        return [autocomplete_index.names[(entity_type, entity_id)] for entity_id in ranked]
+    
+    def popular(self, rank_by: str = "products") -> List[str]:
+        version = (self.version, search_index.version, autocomplete_index.version)
+        cached = self._ranked.get(rank_by)
+        if cached and cached[0] == version:
+            return cached[1]
+        
+        popular = self._top(rank_by, "brand")
+        for category in self._top(rank_by, "category"):
+            if category not in popular:
+                popular.append(category)
+        popular = popular[:10]
+        self._ranked[rank_by] = (version, popular)
+        return popular
+
+popularity_stats = PopularityStats()
+
+catalog_refresh_lock = asyncio.Lock()
+
+def build_catalog_indexes(products: List[dict], rows: Dict[str, List[dict]]) -> tuple:
+    # A build allocates millions of objects, which would otherwise trigger
+    # full collections that stall the loop. Collection is paused for the
+    # build only; nothing it allocates is cyclic garbage
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        index = SearchIndex()
+        index.load(products)
+        autocomplete = AutocompleteIndex()
+        for entity_type, entity_rows in rows.items():
+            autocomplete.load(entity_type, entity_rows)
+        autocomplete.load("product", products)
+        autocomplete.ready = True
+        return index, autocomplete
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+async def refresh_catalog_indexes() -> None:
+    # Full resync of the in-memory catalog. New indexes are built on a worker
+    # thread and swapped in at once, so readers never see a partial index.
+    # Incremental writes made meanwhile go to the live indexes, which record
+    # what they touched; those entries are copied over before the swap so
+    # the older snapshot never undoes them
+    global search_index, autocomplete_index
+    async with catalog_refresh_lock:
+        search_index.touched = set()
+        autocomplete_index.touched = set()
+        try:
+            products = await fetch_all_products()
+            rows = {
+                entity_type: await fetch_suggestion_rows(entity_type)
+                for entity_type in ("brand", "model", "category")
+            }
+            index, autocomplete = await run_blocking(build_catalog_indexes, products, rows)
+        finally:
+            touched_products, search_index.touched = search_index.touched, None
+            touched_names, autocomplete_index.touched = autocomplete_index.touched, None
+        
+        for product_id in touched_products:
+            product = search_index.products.get(product_id)
+            if product is None:
+                index.remove(product_id)
+            else:
+                index.add(product)
+        for entity_type, entity_id in touched_names:
+            name = autocomplete_index.names.get((entity_type, entity_id))
+            if name is None:
+                autocomplete.remove(entity_type, entity_id)
+            else:
+                autocomplete.add(entity_type, entity_id, name)
+        
+        # Versions keep increasing so caches keyed on them never match stale data
+        index.version += search_index.version + 1
+        autocomplete.version += autocomplete_index.version + 1
+        search_index, autocomplete_index = index, autocomplete
+    logger.info(f"Catalog indexes loaded: {len(products)} products")
+
+async def warm_catalog_cache() -> None:
+    # The list endpoints fill catalog_cache as a side effect
+    await get_brands()
+    await get_all_models()
+    await get_categories()
+
+async def catalog_refresh_loop() -> None:
+    while True:
+        await asyncio.sleep(settings.CATALOG_REFRESH_INTERVAL)
+        try:
+            await refresh_catalog_indexes()
+            catalog_version.bump()
+        except Exception as e:
+            logger.error(f"Catalog refresh failed: {str(e)}")
+
+class SyncedIndexUpdates:
+    # Index work announced by other workers, merged and done by one
+    # background task so a burst of writes costs one pass per table
+    SUGGESTION_TABLES = {"car_brands": "brand", "car_models": "model", "categories": "category"}
+    
+    def __init__(self):
+        self.full = False
+        self.tables: set = set()
+        self.products: set = set()
+        self.related: set = set()
+        self._task: Optional[asyncio.Task] = None
+    
+    def _schedule(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    def add(self, event: dict) -> None:
+        self.tables.update(event.get("tables") or ())
+        self.products.update(event.get("products") or ())
+        if event.get("related"):
+            self.related.add(tuple(event["related"]))
+        self._schedule()
+    
+    def resync(self) -> None:
+        self.full = True
+        self._schedule()
+    
+    async def _run(self) -> None:
+        while self.full or self.tables or self.products or self.related:
+            full, self.full = self.full, False
+            tables, self.tables = self.tables, set()
+            products, self.products = self.products, set()
+            related, self.related = self.related, set()
+            try:
+                if full:
+                    await refresh_catalog_indexes()
+                    continue
+                for table in tables & self.SUGGESTION_TABLES.keys():
+                    await load_autocomplete_table(self.SUGGESTION_TABLES[table])
+                for column, value in related:
+                    await reindex_related_products(column, value)
+                await reindex_products(sorted(products))
+            except Exception as e:
+                logger.error(f"Applying catalog changes from other workers failed: {str(e)}")
+
+synced_index_updates = SyncedIndexUpdates()
+
+def apply_catalog_event(event: dict) -> None:
+    for table in event.get("tables") or ():
+        catalog_cache.invalidate(table)
+    catalog_version.bump()
+    synced_index_updates.add(event)
+
+def resync_catalog() -> None:
+    catalog_cache.clear()
+    catalog_version.bump()
+    synced_index_updates.resync()
+
+# Admin stats
+class OrderStats:
+    # Aggregates are updated in place by create_order and
+    # update_order_status, in every worker through the order journal, and
+    # rebuilt from the tables periodically, which also corrects any drift
+    # from writes that raced a rebuild. Cancelled orders are counted per
+    # status but not in revenue or sales
+    def __init__(self):
+        self.ready = False
+        self.version = 0
+        self.reconciled_at: Optional[str] = None
+        self.daily: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, int] = {}
+        self.sold: Dict[int, int] = {}
+        self._summary: Optional[tuple] = None
+    
+    def _apply_order(self, order: dict, sign: int) -> None:
+        day = self.daily.setdefault(str(order.get("created_at") or "")[:10], [0, 0.0, 0.0])
+        day[0] += sign
+        day[1] += sign * float(order.get("total_amount") or 0)
+        day[2] += sign * float(order.get("deposit_amount") or 0)
+    
+    def _apply_items(self, items: List[dict], sign: int) -> None:
+        for item in items:
+            self.sold[item["product_id"]] = self.sold.get(item["product_id"], 0) + sign * item["quantity"]
+    
+    def record_order(self, order: dict, items: List[dict]) -> None:
+        if not self.ready:
+            return
+        self.statuses[order["status"]] = self.statuses.get(order["status"], 0) + 1
+        if order["status"] != "cancelled":
+            self._apply_order(order, 1)
+            self._apply_items(items, 1)
+        self.version += 1
+    
+    def record_status_change(self, order: dict, previous: str, items: Optional[List[dict]]) -> None:
+        if not self.ready or previous == order["status"]:
+            return
+        self.statuses[previous] = self.statuses.get(previous, 0) - 1
+        self.statuses[order["status"]] = self.statuses.get(order["status"], 0) + 1
+        if items is not None:
+            sign = -1 if order["status"] == "cancelled" else 1
+            self._apply_order(order, sign)
+            self._apply_items(items, sign)
+        self.version += 1
+    
+    async def reconcile(self, batch_size: int = 1000) -> None:
+        daily: Dict[str, List[float]] = {}
+        statuses: Dict[str, int] = {}
+        sold: Dict[int, int] = {}
+        cancelled = set()
+        
+        offset = 0
+        while True:
+            orders = (await db_execute(
+                supabase.table("orders").select("id, created_at, status, total_amount, deposit_amount")
+                .order("id").range(offset, offset + batch_size - 1)
+            )).data
+            for order in orders:
+                statuses[order["status"]] = statuses.get(order["status"], 0) + 1
+                if order["status"] == "cancelled":
+                    cancelled.add(order["id"])
+                    continue
+                day = daily.setdefault(str(order.get("created_at") or "")[:10], [0, 0.0, 0.0])
+                day[0] += 1
+                day[1] += float(order.get("total_amount") or 0)
+                day[2] += float(order.get("deposit_amount") or 0)
+            if len(orders) < batch_size:
+                break
+            offset += batch_size
+        
+        offset = 0
+        while True:
+            items = (await db_execute(
+                supabase.table("order_items").select("order_id, product_id, quantity")
+                .order("id").range(offset, offset + batch_size - 1)
+            )).data
+            for item in items:
+                if item["order_id"] not in cancelled:
+                    sold[item["product_id"]] = sold.get(item["product_id"], 0) + item["quantity"]
+            if len(items) < batch_size:
+                break
+            offset += batch_size
+        
+        self.daily, self.statuses, self.sold = daily, statuses, sold
+        popularity_stats.load_orders(sold)
+        # Events from other workers up to now are in the tables already
+        if order_sync is not None:
+            order_sync.skip()
+        self.reconciled_at = datetime.utcnow().isoformat()
+        self.ready = True
+        self.version += 1
+    
+    def summary(self, days: int = 30, limit: int = 10) -> dict:
+        key = (self.version, search_index.version, days, limit)
+        if self._summary and self._summary[0] == key:
+            return self._summary[1]
+        
+        def product_name(product_id: int) -> Optional[str]:
+            product = search_index.products.get(product_id)
+            return product.get("name") if product else None
+        
+        daily = sorted(self.daily.items(), reverse=True)
+        low_stock = heapq.nsmallest(
+            limit,
+            (p for p in search_index.products.values() if p.get("stock_quantity", 0) <= settings.LOW_STOCK_THRESHOLD),
+            key=lambda p: (p.get("stock_quantity", 0), p["id"])
+        )
+        summary = {
+            "reconciled_at": self.reconciled_at,
+            "totals": {
+                "orders": sum(day[0] for _, day in daily),
+                "revenue": round(sum(day[1] for _, day in daily), 2),
+                "deposits": round(sum(day[2] for _, day in daily), 2)
+            },
+            "daily": [
+                {"date": date, "orders": day[0], "revenue": round(day[1], 2), "deposits": round(day[2], 2)}
+                for date, day in daily[:days] if day[0]
+            ],
+            "status_counts": {status: count for status, count in self.statuses.items() if count},
+            "top_products": [
+                {"product_id": product_id, "product_name": product_name(product_id), "quantity": quantity}
+                for product_id, quantity in heapq.nlargest(limit, self.sold.items(), key=lambda x: x[1])
+                if quantity > 0
+            ],
+            "low_stock": [
+                {"product_id": p["id"], "product_name": p.get("name"), "stock_quantity": p.get("stock_quantity")}
+                for p in low_stock
+            ]
+        }
+        self._summary = (key, summary)
+        return summary
+
+order_stats = OrderStats()
+
+ORDER_EVENT_FIELDS = ("id", "created_at", "status", "total_amount", "deposit_amount")
+
+def publish_order_event(order: dict, items: Optional[List[dict]], previous: Optional[str] = None) -> None:
+    if order_sync is None:
+        return
+    order_sync.publish({
+        "order": {field: order.get(field) for field in ORDER_EVENT_FIELDS},
+        "items": items and [{"product_id": item["product_id"], "quantity": item["quantity"]} for item in items],
+        "previous": previous
+    })
+
+order_resync_tasks: set = set()
+
+async def reconcile_order_stats() -> None:
+    try:
+        await order_stats.reconcile()
+    except Exception as e:
+        logger.error(f"Order stats reconciliation failed: {str(e)}")
+
+def resync_order_stats() -> None:
+    task = asyncio.create_task(reconcile_order_stats())
+    order_resync_tasks.add(task)
+    task.add_done_callback(order_resync_tasks.discard)
+
+def apply_order_event(event: dict) -> None:
+    if event["previous"] is None:
+        for item in event["items"]:
+            popularity_stats.record_order(item["product_id"], item["quantity"])
+        order_stats.record_order(event["order"], event["items"])
+    else:
+        order_stats.record_status_change(event["order"], event["previous"], event["items"])
+
+async def order_stats_loop() -> None:
+    while True:
+        await reconcile_order_stats()
+        await asyncio.sleep(settings.ADMIN_STATS_INTERVAL)
+
+# Pagination
+# Cursors are opaque tokens holding the sort mode and the (sort key, id)
+# of the last row served, so deep pages cost the same as the first one
+def encode_cursor(sort_by: Optional[str], key: tuple) -> str:
+    payload = json.dumps({"s": sort_by or "", "k": list(key)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_by: Optional[str]) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload["s"] != (sort_by or ""):
+            raise ValueError("sort mismatch")
+        return tuple(payload["k"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def postgrest_value(value: Any) -> str:
+    if isinstance(value, str):
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return str(value)
+
+def keyset_filter(column: str, desc: bool, after: tuple) -> str:
+    value, row_id = after
+    op = "lt" if desc else "gt"
+    if column == "id":
+        return f"id.{op}.{row_id}"
+    value = postgrest_value(value)
+    return f"{column}.{op}.{value},and({column}.eq.{value},id.{op}.{row_id})"
+
 # Auth
+role_cache = TTLCache(10000, settings.ROLE_CACHE_TTL)
+jwks_client: Optional[jwt.PyJWKClient] = None
+jwks_keys: Dict[str, Any] = {}
+jwks_fetched_at: Optional[float] = None
+jwks_lock = asyncio.Lock()
+
+async def get_signing_key(kid: Optional[str]):
+    # Asymmetric Supabase tokens are checked against the project's JWKS.
+    # The whole key set is fetched at once; an unknown kid refetches it (to
+    # pick up a rotated key) at most once per JWKS_REFRESH_INTERVAL, so
+    # tokens with made-up kids cannot drive calls to Supabase
+    global jwks_client, jwks_keys, jwks_fetched_at
+    if kid in jwks_keys:
+        return jwks_keys[kid]
+    
+    async with jwks_lock:
+        stale = jwks_fetched_at is None or time.monotonic() - jwks_fetched_at >= settings.JWKS_REFRESH_INTERVAL
+        if kid not in jwks_keys and stale:
+            if jwks_client is None:
+                jwks_client = jwt.PyJWKClient(f"{settings.SUPABASE_URL}/auth/v1/.well-known/jwks.json")
+            # Failed fetches also wait out the interval
+            jwks_fetched_at = time.monotonic()
+            signing_keys = await run_blocking(jwks_client.get_signing_keys, True)
+            jwks_keys = {signing_key.key_id: signing_key.key for signing_key in signing_keys}
+    
+    if kid not in jwks_keys:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return jwks_keys[kid]
+
+async def decode_token(token: str) -> AuthenticatedUser:
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    
+    if algorithm == "HS256":
+        if not settings.SUPABASE_JWT_SECRET:
+            # No secret configured: ask Supabase to verify the token
+            response = await run_blocking(supabase.auth.get_user, token)
+            if not response or not response.user:
+                raise HTTPException(status_code=401, detail="Invalid token")
+            return AuthenticatedUser(id=response.user.id, email=response.user.email)
+        key = settings.SUPABASE_JWT_SECRET
+    elif algorithm in ("RS256", "ES256"):
+        key = await get_signing_key(header.get("kid"))
+    else:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    try:
+        claims = jwt.decode(token, key, algorithms=[algorithm], audience="authenticated")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return AuthenticatedUser(id=claims["sub"], email=claims.get("email"))
+
+async def get_user_role(user_id: str) -> str:
+    role = role_cache.get(("users", user_id))
+    if role is None:
+        user_data = await db_execute(supabase.table("users").select("role").eq("id", user_id))
+        role = (user_data.data[0].get("role") if user_data.data else None) or "customer"
+        role_cache.set(("users", user_id), role)
+    return role
+
+def set_user_role(user_id: str, role: Optional[str]) -> None:
+    # Called wherever a role is read fresh or written, so the cache
+    # never outlives a known change
+    role_cache.set(("users", user_id), role or "customer")
+
+async def authenticate(token: str) -> AuthenticatedUser:
+    user = await decode_token(token)
+    user.role = await get_user_role(user.id)
+    return user
+
 async def verify_admin_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        response = supabase.auth.get_user(credentials.credentials)
+        user = await authenticate(credentials.credentials)
         
-        if not response or not response.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_data = supabase.table("users").select("role").eq("id", response.user.id).execute()
-        
-        if not user_data.data or user_data.data[0].get("role") != "admin":
+        if user.role != "admin":
             raise HTTPException(status_code=403, detail="Admin access required")
         
-        return response.user
+        return user
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Auth failed: {str(e)}")
         raise HTTPException(status_code=401, detail="Authentication failed")
 
+# Image derivatives
+# Every upload is stored as <folder>/<sha256>/original.<ext> next to resized
+# WebP copies, so variant URLs can be derived from the original's URL and
+# identical files always map to the same objects. Without Pillow no copies
+# are made and the file is stored as source.<ext>, which has no variants
+IMAGE_VARIANTS = {"thumb": 160, "card": 480, "detail": 1200}
+ORIGINAL_IMAGE_PATTERN = re.compile(r"/original\.(jpg|png|webp)$")
+
+image_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="images")
+
+def image_variants(url: Optional[str]) -> Optional[Dict[str, str]]:
+    if not url or not ORIGINAL_IMAGE_PATTERN.search(url):
+        return None
+    return {name: ORIGINAL_IMAGE_PATTERN.sub(f"/{name}.webp", url) for name in IMAGE_VARIANTS}
+
+def add_image_variants(rows: List[dict], url_field: str, variants_field: str) -> List[dict]:
+    for row in rows:
+        row[variants_field] = image_variants(row.get(url_field))
+    return rows
+
+def render_variants(content: bytes) -> Dict[str, bytes]:
+    # CPU bound; runs on image_executor (Pillow releases the GIL while
+    # decoding, resizing and encoding)
+    with Image.open(io.BytesIO(content)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("P", "LA") else "RGB")
+        
+        variants = {}
+        for name, size in IMAGE_VARIANTS.items():
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            buffer = io.BytesIO()
+            variant.save(buffer, "WEBP", quality=80, method=4)
+            variants[name] = buffer.getvalue()
+        return variants
+
+async def make_derivatives(content: bytes) -> Dict[str, bytes]:
+    if Image is None:
+        return {}
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(image_executor, render_variants, content)
+    except Exception as e:
+        logger.warning(f"Image processing failed: {str(e)}")
+        raise HTTPException(status_code=400, detail="Invalid image")
+
 # Upload helpers
-async def upload_to_storage(file: UploadFile, bucket: str, folder: str = "") -> str:
+upload_semaphore = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+
+# (bucket, object path) -> public URL of objects known to be in storage.
+# A miss is still safe: storage rejects the duplicate and it is reused
+upload_index = TTLCache(settings.UPLOAD_INDEX_SIZE, 86400)
+
+def is_duplicate_object(error: Exception) -> bool:
+    message = str(error)
+    return "already exists" in message or "Duplicate" in message
+
+async def upload_to_storage(
+    file: UploadFile,
+    bucket: str,
+    folder: str = "",
+    uploaded: Optional[List[tuple]] = None
+) -> str:
     try:
-        validate_file_size(file)
-        validate_file_type(file)
-        
-        ext = file.filename.split('.')[-1].lower()
-        filename = f"{folder}/{uuid.uuid4()}.{ext}" if folder else f"{uuid.uuid4()}.{ext}"
-        
-        content = await file.read()
-        
-        supabase.storage.from_(bucket).upload(
-            filename,
-            content,
-            {"content-type": file.content_type, "cache-control": "3600"}
-        )
+        async with upload_semaphore:
+            content = await read_upload(file)
+            content_type, ext = sniff_image_type(content)
+            
+            digest = hashlib.sha256(content).hexdigest()
+            prefix = f"{folder}/{digest}" if folder else digest
+            filename = f"{prefix}/{'original' if Image is not None else 'source'}.{ext}"
+            
+            url = upload_index.get((bucket, filename))
+            if url:
+                return url
+            
+            derivatives = await make_derivatives(content)
+            objects = [(filename, content, content_type)] + [
+                (f"{prefix}/{name}.webp", data, "image/webp") for name, data in derivatives.items()
+            ]
+            
+            async def put(path: str, data: bytes, object_type: str) -> None:
+                try:
+                    await run_blocking(
+                        supabase.storage.from_(bucket).upload,
+                        path,
+                        data,
+                        {"content-type": object_type, "cache-control": "3600"}
+                    )
+                except Exception as e:
+                    # Stored by an earlier upload; it is not ours to roll back
+                    if is_duplicate_object(e):
+                        return
+                    raise
+                if uploaded is not None:
+                    uploaded.append((bucket, path))
+            
+            # Every put settles before an error is raised, so none of them
+            # can record an object after the caller has cleaned up
+            results = await asyncio.gather(*(put(*obj) for obj in objects), return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if errors:
+                raise errors[0]
         
-        url = supabase.storage.from_(bucket).get_public_url(filename)
-        return url.rstrip('?')
+        url = supabase.storage.from_(bucket).get_public_url(filename).rstrip('?')
+        upload_index.set((bucket, filename), url)
+        return url
         
     except HTTPException:
         raise
@@ -300,32 +1963,150 @@ async def upload_to_storage(file: UploadFile, bucket: str, folder: str = "") ->
         logger.error(f"Upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Upload failed")
 
+async def remove_from_storage(objects: List[tuple]) -> None:
+    buckets: Dict[str, List[str]] = {}
+    for bucket, path in objects:
+        buckets.setdefault(bucket, []).append(path)
+        upload_index.discard((bucket, path))
+    for bucket, paths in buckets.items():
+        try:
+            await run_blocking(supabase.storage.from_(bucket).remove, paths)
+        except Exception as e:
+            logger.error(f"Storage cleanup failed for {bucket}: {str(e)}")
+
+async def upload_many(
+    files: List[UploadFile],
+    bucket: str,
+    folder: str,
+    uploaded: List[tuple]
+) -> List[str]:
+    # Uploads run concurrently (bounded by upload_semaphore); if any of
+    # them fails, the ones that already landed are removed again
+    results = await asyncio.gather(
+        *(upload_to_storage(file, bucket, folder, uploaded) for file in files),
+        return_exceptions=True
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        await remove_from_storage(uploaded)
+        uploaded.clear()
+        raise errors[0]
+    return results
+
 async def upload_logo_to_supabase(file: UploadFile) -> str:
     return await upload_to_storage(file, "brands-logos", "logos")
 
-async def upload_image_to_supabase(file: UploadFile) -> str:
-    return await upload_to_storage(file, "product-images", "products")
+async def upload_product_images(files: List[UploadFile], uploaded: List[tuple]) -> List[str]:
+    files = [file for file in files[:10] if file.filename]
+    return await upload_many(files, "product-images", "products", uploaded)
 
 async def upload_model_image_to_supabase(file: UploadFile) -> str:
     return await upload_to_storage(file, "car-models", "models")
 
 # Health Check
+# Health endpoints never touch the database themselves: a background probe
+# checks Supabase on an interval and readiness reports its last result
+class UpstreamProbe:
+    def __init__(self):
+        self.checks = 0
+        self.consecutive_failures = 0
+        self.last_latency_ms: Optional[float] = None
+        self.last_checked: Optional[str] = None
+        self.last_error: Optional[str] = None
+    
+    @property
+    def healthy(self) -> bool:
+        return self.last_checked is not None and self.consecutive_failures < settings.HEALTH_MAX_FAILURES
+    
+    async def run(self) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                db_execute(supabase.table("users").select("count").limit(1)),
+                timeout=settings.HEALTH_PROBE_TIMEOUT
+            )
+            self.consecutive_failures = 0
+            self.last_error = None
+        except Exception as e:
+            self.consecutive_failures += 1
+            self.last_error = str(e) or type(e).__name__
+            logger.warning(f"Upstream probe failed ({self.consecutive_failures} in a row): {self.last_error}")
+        self.checks += 1
+        self.last_latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.last_checked = datetime.utcnow().isoformat()
+    
+    def report(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "checks": self.checks,
+            "consecutive_failures": self.consecutive_failures,
+            "last_latency_ms": self.last_latency_ms,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error
+        }
+
+upstream_probe = UpstreamProbe()
+
+async def upstream_probe_loop() -> None:
+    while True:
+        await upstream_probe.run()
+        await asyncio.sleep(settings.HEALTH_PROBE_INTERVAL)
+
 @app.get("/health")
 @app.get("/api/health")
 async def health_check():
-    try:
-        supabase.table("users").select("count").limit(1).execute()
-        return {
-            "status": "healthy",
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "environment": settings.ENVIRONMENT
+    }
+
+@app.get("/ready")
+@app.get("/api/ready")
+async def readiness_check():
+    ready = upstream_probe.healthy
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
             "timestamp": datetime.utcnow().isoformat(),
-            "environment": settings.ENVIRONMENT
+            "upstream": upstream_probe.report(),
+            "caches": {
+                "search_index": {"ready": search_index.ready, "products": len(search_index.products)},
+                "autocomplete": {"ready": autocomplete_index.ready},
+                "order_stats": {"ready": order_stats.ready, "reconciled_at": order_stats.reconciled_at},
+                "catalog": {"size": catalog_cache.stats()["size"], "hit_ratio": catalog_cache.stats()["hit_ratio"]}
+            }
         }
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return JSONResponse(
-            status_code=503,
-            content={"status": "unhealthy"}
-        )
+    )
+
+# Metrics endpoint
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    if settings.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Admin stats
+@app.get("/api/admin/stats")
+async def get_admin_stats(days: int = Query(30, ge=1, le=366), admin=Depends(verify_admin_token)):
+    if not order_stats.ready:
+        raise HTTPException(status_code=503, detail="Stats are still loading")
+    return order_stats.summary(days)
+
+# Cache stats
+@app.get("/api/cache/stats")
+async def get_cache_stats(admin=Depends(verify_admin_token)):
+    return {
+        "catalog": catalog_cache.stats(),
+        "roles": role_cache.stats(),
+        "uploads": upload_index.stats(),
+        "coalescing": {
+            "upstream_reads": metrics.upstream_reads,
+            "coalesced_reads": metrics.coalesced_reads,
+            "in_flight": len(single_flight.inflight)
+        }
+    }
 
 # API Endpoints (same as before, just adding /api prefix where needed)
 
@@ -333,8 +2114,11 @@ async def health_check():
 @app.get("/api/brands")
 async def get_brands():
     try:
-        result = supabase.table("car_brands").select("*").order("name").execute()
-        return result.data
+        return await cached_query(
+            ("car_brands",),
+            supabase.table("car_brands").select("*").order("name"),
+            lambda rows: add_image_variants(rows, "logo_url", "logo_variants")
+        )
     except Exception as e:
         logger.error(f"Get brands failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch brands")
@@ -355,7 +2139,9 @@ async def create_brand(
             "color": color,
             "logo_url": logo_url
         }
-        result = supabase.table("car_brands").insert(brand_data).execute()
+        result = await db_execute(supabase.table("car_brands").insert(brand_data))
+        invalidate_catalog("car_brands")
+        autocomplete_index.add("brand", result.data[0]["id"], name)
         return result.data[0]
     except Exception as e:
         logger.error(f"Create brand failed: {str(e)}")
@@ -382,9 +2168,12 @@ async def update_brand(
             "color": color,
             "logo_url": logo_url
         }
-        result = supabase.table("car_brands").update(brand_data).eq("id", brand_id).execute()
+        result = await db_execute(supabase.table("car_brands").update(brand_data).eq("id", brand_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Brand not found")
+        invalidate_catalog("car_brands", related=("brand_id", brand_id))
+        autocomplete_index.add("brand", brand_id, name)
+        await reindex_related_products("brand_id", brand_id)
         return result.data[0]
     except Exception as e:
         logger.error(f"Update brand failed: {str(e)}")
@@ -393,9 +2182,13 @@ async def update_brand(
 @app.delete("/api/brands/{brand_id}", status_code=204)
 async def delete_brand(brand_id: int, admin=Depends(verify_admin_token)):
     try:
-        result = supabase.table("car_brands").delete().eq("id", brand_id).execute()
+        result = await db_execute(supabase.table("car_brands").delete().eq("id", brand_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Brand not found")
+        invalidate_catalog("car_brands", "car_models", related=("brand_id", brand_id))
+        autocomplete_index.remove("brand", brand_id)
+        await load_autocomplete_table("model")
+        await reindex_related_products("brand_id", brand_id)
         return None
     except Exception as e:
         logger.error(f"Delete brand failed: {str(e)}")
@@ -405,16 +2198,22 @@ async def delete_brand(brand_id: int, admin=Depends(verify_admin_token)):
 @app.get("/api/brands/{brand_id}/models")
 async def get_models(brand_id: int):
     try:
-        result = supabase.table("car_models").select("*").eq("brand_id", brand_id).order("name").execute()
-        return result.data
+        return await cached_query(
+            ("car_models", brand_id),
+            supabase.table("car_models").select("*").eq("brand_id", brand_id).order("name"),
+            lambda rows: add_image_variants(rows, "image_url", "image_variants")
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch models")
 
 @app.get("/api/models")
 async def get_all_models():
     try:
-        result = supabase.table("car_models").select("*").order("name").execute()
-        return result.data
+        return await cached_query(
+            ("car_models",),
+            supabase.table("car_models").select("*").order("name"),
+            lambda rows: add_image_variants(rows, "image_url", "image_variants")
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch models")
 
@@ -440,7 +2239,9 @@ async def create_model(
         if image_url:
             model_data["image_url"] = image_url
         
-        result = supabase.table("car_models").insert(model_data).execute()
+        result = await db_execute(supabase.table("car_models").insert(model_data))
+        invalidate_catalog("car_models")
+        autocomplete_index.add("model", result.data[0]["id"], name)
         return result.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to create model")
@@ -469,9 +2270,12 @@ async def update_model(
         if image_url:
             model_data["image_url"] = image_url
         
-        result = supabase.table("car_models").update(model_data).eq("id", model_id).execute()
+        result = await db_execute(supabase.table("car_models").update(model_data).eq("id", model_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Model not found")
+        invalidate_catalog("car_models", related=("model_id", model_id))
+        autocomplete_index.add("model", model_id, name)
+        await reindex_related_products("model_id", model_id)
         return result.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to update model")
@@ -479,9 +2283,12 @@ async def update_model(
 @app.delete("/api/models/{model_id}", status_code=204)
 async def delete_model(model_id: int, admin=Depends(verify_admin_token)):
     try:
-        result = supabase.table("car_models").delete().eq("id", model_id).execute()
+        result = await db_execute(supabase.table("car_models").delete().eq("id", model_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Model not found")
+        invalidate_catalog("car_models", related=("model_id", model_id))
+        autocomplete_index.remove("model", model_id)
+        await reindex_related_products("model_id", model_id)
         return None
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to delete model")
@@ -490,8 +2297,10 @@ async def delete_model(model_id: int, admin=Depends(verify_admin_token)):
 @app.get("/api/categories")
 async def get_categories():
     try:
-        result = supabase.table("categories").select("*").order("name").execute()
-        return result.data
+        return await cached_query(
+            ("categories",),
+            supabase.table("categories").select("*").order("name")
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch categories")
 
@@ -499,7 +2308,9 @@ async def get_categories():
 async def create_category(category: Category, admin=Depends(verify_admin_token)):
     try:
         data = category.dict(exclude={'id'}, exclude_none=True)
-        result = supabase.table("categories").insert(data).execute()
+        result = await db_execute(supabase.table("categories").insert(data))
+        invalidate_catalog("categories")
+        autocomplete_index.add("category", result.data[0]["id"], category.name)
         return result.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to create category")
@@ -508,9 +2319,12 @@ async def create_category(category: Category, admin=Depends(verify_admin_token))
 async def update_category(category_id: int, category: Category, admin=Depends(verify_admin_token)):
     try:
         data = category.dict(exclude={'id'}, exclude_none=True)
-        result = supabase.table("categories").update(data).eq("id", category_id).execute()
+        result = await db_execute(supabase.table("categories").update(data).eq("id", category_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Category not found")
+        invalidate_catalog("categories", related=("category_id", category_id))
+        autocomplete_index.add("category", category_id, category.name)
+        await reindex_related_products("category_id", category_id)
         return result.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to update category")
@@ -518,9 +2332,12 @@ async def update_category(category_id: int, category: Category, admin=Depends(ve
 @app.delete("/api/categories/{category_id}", status_code=204)
 async def delete_category(category_id: int, admin=Depends(verify_admin_token)):
     try:
-        result = supabase.table("categories").delete().eq("id", category_id).execute()
+        result = await db_execute(supabase.table("categories").delete().eq("id", category_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Category not found")
+        invalidate_catalog("categories", related=("category_id", category_id))
+        autocomplete_index.remove("category", category_id)
+        await reindex_related_products("category_id", category_id)
         return None
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to delete category")
@@ -538,14 +2355,9 @@ async def create_product(
     images: List[UploadFile] = File(default=[]),
     admin=Depends(verify_admin_token)
 ):
+    uploaded: List[tuple] = []
     try:
-        image_urls = []
-        if images:
-            for image in images[:10]:
-                if not image.filename:
-                    continue
-                url = await upload_image_to_supabase(image)
-                image_urls.append(url)
+        image_urls = await upload_product_images(images or [], uploaded)
         
         product_data = {
             "name": name,
@@ -563,9 +2375,15 @@ async def create_product(
         if model_id and int(model_id) > 0:
             product_data["model_id"] = int(model_id)
         
-        result = supabase.table("products").insert(product_data).execute()
+        result = await db_execute(supabase.table("products").insert(product_data))
+        invalidate_catalog("products", products=[result.data[0]["id"]])
+        await reindex_product(result.data[0]["id"])
         return result.data[0]
+    except HTTPException:
+        await remove_from_storage(uploaded)
+        raise
     except Exception as e:
+        await remove_from_storage(uploaded)
         logger.error(f"Create product failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create product")
 
@@ -583,9 +2401,8 @@ async def update_product(
     existing_images: Optional[str] = Form(None),
     admin=Depends(verify_admin_token)
 ):
+    uploaded: List[tuple] = []
     try:
-        import json
-        
         existing_image_urls = []
         if existing_images and existing_images not in ('null', ''):
             try:
@@ -593,12 +2410,7 @@ async def update_product(
             except:
                 existing_image_urls = []
         
-        if images:
-            for image in images[:10]:
-                if not image.filename:
-                    continue
-                url = await upload_image_to_supabase(image)
-                existing_image_urls.append(url)
+        existing_image_urls.extend(await upload_product_images(images or [], uploaded))
         
         product_data = {
             "name": name,
@@ -615,13 +2427,202 @@ async def update_product(
         product_data["brand_id"] = int(brand_id) if brand_id and int(brand_id) > 0 else None
         product_data["model_id"] = int(model_id) if model_id and int(model_id) > 0 else None
         
-        result = supabase.table("products").update(product_data).eq("id", product_id).execute()
+        result = await db_execute(supabase.table("products").update(product_data).eq("id", product_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Product not found")
+        invalidate_catalog("products", products=[product_id])
+        await reindex_product(product_id)
         return result.data[0]
+    except HTTPException:
+        await remove_from_storage(uploaded)
+        raise
     except Exception as e:
+        await remove_from_storage(uploaded)
         raise HTTPException(status_code=500, detail="Failed to update product")
 
+def patch_errors(patch: ProductPatch) -> Optional[str]:
+    if patch.price is not None and patch.price_delta is not None:
+        return "Give either price or price_delta"
+    if patch.stock_quantity is not None and patch.stock_delta is not None:
+        return "Give either stock_quantity or stock_delta"
+    if all(value is None for value in (patch.price, patch.stock_quantity, patch.price_delta, patch.stock_delta)):
+        return "Nothing to update"
+    return None
+
+BULK_PATCH_COLUMNS = (("price", "price_delta"), ("stock_quantity", "stock_delta"))
+BULK_PATCH_RETRIES = 5
+
+def patched_values(changes: Dict[str, tuple], row: dict) -> dict:
+    values = {}
+    for column, (kind, value) in changes.items():
+        if kind == "set":
+            values[column] = value
+        elif column == "price":
+            values[column] = round(float(row[column]) + value, 2)
+        else:
+            values[column] = row[column] + value
+    return values
+
+def patched_value_error(values: dict) -> Optional[str]:
+    if "price" in values and float(values["price"]) <= 0:
+        return "Price must be positive"
+    if "stock_quantity" in values and values["stock_quantity"] < 0:
+        return "Stock cannot be negative"
+    return None
+
+async def write_product_deltas(product_id: int, changes: Dict[str, tuple], row: dict) -> dict:
+    # PostgREST cannot express stock = stock + delta, so a delta is written
+    # as a compare-and-set against the values it was computed from; if the
+    # row moved in the meantime it is read again and the delta reapplied
+    for _ in range(BULK_PATCH_RETRIES):
+        values = patched_values(changes, row)
+        error = patched_value_error(values)
+        if error:
+            return {"id": product_id, "status": "invalid", "error": error}
+        
+        query = supabase.table("products").update(values).eq("id", product_id)
+        for column, (kind, _) in changes.items():
+            if kind == "delta":
+                query = query.eq(column, row[column])
+        result = await db_execute(query)
+        if result.data:
+            return {"id": product_id, "status": "updated", "row": result.data[0]}
+        
+        current = (await db_execute(
+            supabase.table("products").select("id, price, stock_quantity").eq("id", product_id)
+        )).data
+        if not current:
+            return {"id": product_id, "status": "not_found"}
+        row = current[0]
+    return {"id": product_id, "status": "conflict", "error": "Product changed concurrently"}
+
+@app.patch("/api/products/bulk")
+async def bulk_update_products(update: BulkProductPatch, admin=Depends(verify_admin_token)):
+    # Only price and stock_quantity are written, so concurrent edits to any
+    # other column are never reverted. Absolute values go out as one update
+    # per distinct value set; deltas are applied per product against the
+    # value they were computed from, so concurrent restocks all count.
+    # Nothing is written unless every item validates; once writes start,
+    # each item reports its own outcome and the response is 207 if any of
+    # them was not applied
+    try:
+        invalid = [{"id": patch.id, "error": error} for patch in update.items if (error := patch_errors(patch))]
+        if invalid:
+            raise HTTPException(status_code=400, detail={"message": "Invalid updates", "items": invalid})
+        
+        # Several entries for one product are folded in order into an
+        # absolute value or a summed delta per column
+        changes: Dict[int, Dict[str, tuple]] = {}
+        for patch in update.items:
+            product_changes = changes.setdefault(patch.id, {})
+            for column, delta_field in BULK_PATCH_COLUMNS:
+                value, delta = getattr(patch, column), getattr(patch, delta_field)
+                if value is not None:
+                    product_changes[column] = ("set", value)
+                elif delta is not None:
+                    kind, current = product_changes.get(column, ("delta", 0))
+                    product_changes[column] = (kind, current + delta)
+        
+        product_ids = list(changes)
+        result = await db_execute(
+            supabase.table("products").select("id, price, stock_quantity").in_("id", product_ids)
+        )
+        rows = {row["id"]: row for row in result.data}
+        
+        missing = [product_id for product_id in product_ids if product_id not in rows]
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail={"message": "Products not found", "items": [{"product_id": product_id} for product_id in missing]}
+            )
+        
+        invalid = [
+            {"id": product_id, "error": error}
+            for product_id in product_ids
+            if (error := patched_value_error(patched_values(changes[product_id], rows[product_id])))
+        ]
+        if invalid:
+            raise HTTPException(status_code=400, detail={"message": "Invalid updates", "items": invalid})
+        
+        groups: Dict[tuple, List[int]] = {}
+        deltas = []
+        for product_id in product_ids:
+            product_changes = changes[product_id]
+            if any(kind == "delta" for kind, _ in product_changes.values()):
+                deltas.append(product_id)
+            else:
+                groups.setdefault(tuple(sorted(patched_values(product_changes, {}).items())), []).append(product_id)
+        
+        async def write_values(values: dict, ids: List[int]) -> List[dict]:
+            try:
+                result = await db_execute(supabase.table("products").update(values).in_("id", ids))
+            except Exception as e:
+                logger.error(f"Bulk product update failed for {ids}: {str(e)}")
+                return [{"id": product_id, "status": "failed", "error": "Update failed"} for product_id in ids]
+            # Rows deleted since they were read are simply not returned
+            written = {row["id"]: row for row in result.data}
+            return [
+                {"id": product_id, "status": "updated", "row": written[product_id]}
+                if product_id in written else {"id": product_id, "status": "not_found"}
+                for product_id in ids
+            ]
+        
+        async def write_deltas(product_id: int) -> List[dict]:
+            try:
+                return [await write_product_deltas(product_id, changes[product_id], rows[product_id])]
+            except Exception as e:
+                logger.error(f"Bulk product update failed for {product_id}: {str(e)}")
+                return [{"id": product_id, "status": "failed", "error": "Update failed"}]
+        
+        written = await asyncio.gather(
+            *(write_values(dict(values), ids) for values, ids in groups.items()),
+            *(write_deltas(product_id) for product_id in deltas)
+        )
+        outcomes = {outcome["id"]: outcome for group in written for outcome in group}
+        updated = {product_id: outcome["row"] for product_id, outcome in outcomes.items() if outcome["status"] == "updated"}
+        
+        if updated:
+            invalidate_catalog("products", products=list(updated))
+            if search_index.ready:
+                # Only price and stock changed, so indexed rows are patched
+                # in place of a reload
+                for product_id, row in updated.items():
+                    product = search_index.products.get(product_id)
+                    if product is not None:
+                        search_index.add({**product, "price": row["price"], "stock_quantity": row["stock_quantity"]})
+        
+        logger.info(f"Bulk updated {len(updated)} of {len(product_ids)} products")
+        items = []
+        for product_id in product_ids:
+            outcome = outcomes[product_id]
+            row = outcome.pop("row", None)
+            if row is not None:
+                outcome.update(price=row["price"], stock_quantity=row["stock_quantity"])
+            items.append(outcome)
+        return ORJSONResponse(items, status_code=200 if len(updated) == len(product_ids) else 207)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Bulk product update failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to update products")
+
+# sort_by -> (column, descending) for queries pushed down to PostgREST
+PRODUCT_SORT_COLUMNS = {
+    "price_asc": ("price", False),
+    "price_desc": ("price", True),
+    "name": ("name", False),
+    "created_at": ("created_at", True),
+}
+
+# sort_by -> ((score, product) key, descending) for in-memory search results
+SEARCH_SORT_KEYS = {
+    "relevance": (lambda x: (-x[0], x[1]["id"]), False),
+    "price_asc": (lambda x: (float(x[1].get('price', 0)), x[1]["id"]), False),
+    "price_desc": (lambda x: (float(x[1].get('price', 0)), x[1]["id"]), True),
+    "name": (lambda x: (normalize_text(x[1].get('name', '')), x[1]["id"]), False),
+    "created_at": (lambda x: (x[1].get('created_at') or "", x[1]["id"]), True),
+}
+
 @app.get("/api/products")
 async def get_products(
     category_id: Optional[int] = None,
@@ -630,15 +2631,29 @@ async def get_products(
     search: Optional[str] = None,
     sort_by: Optional[str] = None,
     limit: int = 100,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None
 ):
     try:
-        query = supabase.table("products").select("""
-            *,
-            categories(id, name),
-            car_brands(id, name, logo_url),
-            car_models(id, name)
-        """)
+        after = decode_cursor(cursor, sort_by) if cursor else None
+        headers = {}
+        
+        if search and search_index.ready:
+            popularity_stats.record_search(search)
+            search_terms = normalize_text(search).split()
+            key, reverse = SEARCH_SORT_KEYS.get(sort_by, SEARCH_SORT_KEYS["relevance"])
+            page, more = search_index.search(
+                search_terms, key, reverse, offset, limit, after, category_id, brand_id, model_id
+            )
+            if more and page:
+                headers["X-Next-Cursor"] = encode_cursor(sort_by, key(page[-1]))
+            return ORJSONResponse(
+                [{**product, 'relevance_score': score} for score, product in page],
+                headers=headers
+            )
+        
+        column, desc = PRODUCT_SORT_COLUMNS.get(sort_by, ("id", False))
+        query = supabase.table("products").select(PRODUCT_SELECT)
         
         if category_id:
             query = query.eq("category_id", category_id)
@@ -647,20 +2662,20 @@ async def get_products(
         if model_id:
             query = query.eq("model_id", model_id)
         
-        query = query.range(offset, offset + limit - 1)
-        result = query.execute()
-        products = result.data
+        query = query.order(column, desc=desc)
+        if column != "id":
+            query = query.order("id", desc=desc)
         
-        formatted_products = []
-        for product in products:
-            product_data = {
-                **product,
-                'category_name': product.get('categories', {}).get('name') if product.get('categories') else None,
-                'brand_name': product.get('car_brands', {}).get('name') if product.get('car_brands') else None,
-                'brand_logo': product.get('car_brands', {}).get('logo_url') if product.get('car_brands') else None,
-                'model_name': product.get('car_models', {}).get('name') if product.get('car_models') else None,
-            }
-            formatted_products.append(product_data)
+        if after is not None:
+            query = query.or_(keyset_filter(column, desc, after)).limit(limit)
+        else:
+            query = query.range(offset, offset + limit - 1)
+        result = await db_execute(query)
+        formatted_products = [format_product(product) for product in result.data]
+        
+        if len(result.data) == limit and not search:
+            last = result.data[-1]
+            headers["X-Next-Cursor"] = encode_cursor(sort_by, (last.get(column), last["id"]))
         
         if search:
             normalized_search = normalize_text(search)
@@ -678,39 +2693,59 @@ async def get_products(
             
             formatted_products = scored_products
         
-        if sort_by and formatted_products:
-            if sort_by == "price_asc":
-                formatted_products.sort(key=lambda x: float(x.get('price', 0)))
-            elif sort_by == "price_desc":
-                formatted_products.sort(key=lambda x: float(x.get('price', 0)), reverse=True)
-            elif sort_by == "name":
-                formatted_products.sort(key=lambda x: normalize_text(x.get('name', '')))
-        
-        return formatted_products
+        return ORJSONResponse(formatted_products, headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Failed to fetch products")
+
+MAX_BATCH_IDS = 100
+
+async def get_products_by_id(product_ids: List[int]) -> Dict[int, dict]:
+    # Served from the search index when it is loaded; only ids it does not
+    # hold go to the database, in a single query
+    found: Dict[int, dict] = {}
+    if search_index.ready:
+        for product_id in product_ids:
+            product = search_index.products.get(product_id)
+            if product is not None:
+                found[product_id] = product
+    
+    missing = [product_id for product_id in product_ids if product_id not in found]
+    if missing:
+        result = await db_execute(supabase.table("products").select(PRODUCT_SELECT).in_("id", missing))
+        for product in result.data:
+            found[product["id"]] = format_product(product)
+    return found
+
+# Registered before /api/products/{product_id} so "batch" is not parsed as an id
+@app.get("/api/products/batch")
+async def get_products_batch(ids: str):
+    try:
+        product_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+    if not product_ids:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    
+    try:
+        products = await get_products_by_id(product_ids)
+        return ORJSONResponse([products[product_id] for product_id in product_ids if product_id in products])
     except Exception as e:
+        logger.error(f"Batch product fetch failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch products")
 
 @app.get("/api/products/{product_id}")
 async def get_product(product_id: int):
     try:
-        result = supabase.table("products").select("""
-            *,
-            categories(id, name),
-            car_brands(id, name, logo_url),
-            car_models(id, name)
-        """).eq("id", product_id).execute()
+        result = await db_execute(supabase.table("products").select(PRODUCT_SELECT).eq("id", product_id))
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        product = result.data[0]
-        return {
-            **product,
-            'category_name': product.get('categories', {}).get('name') if product.get('categories') else None,
-            'brand_name': product.get('car_brands', {}).get('name') if product.get('car_brands') else None,
-            'brand_logo': product.get('car_brands', {}).get('logo_url') if product.get('car_brands') else None,
-            'model_name': product.get('car_models', {}).get('name') if product.get('car_models') else None,
-        }
+        return ORJSONResponse(format_product(result.data[0]))
     except HTTPException:
         raise
     except Exception as e:
@@ -719,13 +2754,307 @@ async def get_product(product_id: int):
 @app.delete("/api/products/{product_id}", status_code=204)
 async def delete_product(product_id: int, admin=Depends(verify_admin_token)):
     try:
-        result = supabase.table("products").delete().eq("id", product_id).execute()
+        result = await db_execute(supabase.table("products").delete().eq("id", product_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Product not found")
+        invalidate_catalog("products", products=[product_id])
+        search_index.remove(product_id)
+        autocomplete_index.remove("product", product_id)
         return None
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to delete product")
 
+# Product import
+# Uploads are spooled to a temp file and processed by a background job in
+# batches, so memory stays flat however large the supplier file is
+IMPORT_BATCH_SIZE = 500
+MAX_IMPORT_ERRORS = 500
+MAX_IMPORT_JOBS = 50
+
+import_jobs: "OrderedDict[str, dict]" = OrderedDict()
+import_tasks: set = set()
+
+# With several workers a job is also saved next to the sync journal, so its
+# status can be read from whichever worker answers the poll
+IMPORT_JOBS_DIR = f"{settings.CATALOG_SYNC_FILE}.imports" if settings.CATALOG_SYNC_FILE else None
+IMPORT_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+def save_import_job(job: dict) -> None:
+    if IMPORT_JOBS_DIR is None:
+        return
+    os.makedirs(IMPORT_JOBS_DIR, exist_ok=True)
+    path = os.path.join(IMPORT_JOBS_DIR, f"{job['id']}.json")
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(orjson.dumps(job))
+    os.replace(f"{path}.tmp", path)
+
+def load_import_job(job_id: str) -> Optional[dict]:
+    if IMPORT_JOBS_DIR is None or not IMPORT_JOB_ID.match(job_id):
+        return None
+    try:
+        with open(os.path.join(IMPORT_JOBS_DIR, f"{job_id}.json"), "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+def prune_import_jobs() -> None:
+    # Running jobs are saved after every batch, so the oldest files are
+    # finished ones
+    if IMPORT_JOBS_DIR is None:
+        return
+    entries = []
+    for entry in os.scandir(IMPORT_JOBS_DIR):
+        try:
+            entries.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            pass
+    for _, path in sorted(entries)[:-MAX_IMPORT_JOBS]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def imports_running() -> bool:
+    # Checked by start.py, which keeps a worker from being recycled while
+    # one of its imports is still writing
+    return bool(import_tasks)
+
+def iter_import_rows(path: str, import_format: str):
+    # Yields (row, error) pairs; runs on a worker thread one batch at a time
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if import_format == "csv":
+            for row in csv.DictReader(f):
+                yield row, None
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                row = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                yield None, "Invalid JSON"
+                continue
+            yield (row, None) if isinstance(row, dict) else (None, "Expected a JSON object")
+
+async def load_import_lookups() -> Dict[str, dict]:
+    brands = (await db_execute(supabase.table("car_brands").select("id, name"))).data
+    models = (await db_execute(supabase.table("car_models").select("id, name, brand_id"))).data
+    categories = (await db_execute(supabase.table("categories").select("id, name"))).data
+    
+    model_ids = {}
+    for model in models:
+        name = normalize_text(model["name"])
+        model_ids[(model.get("brand_id"), name)] = model["id"]
+        model_ids.setdefault((None, name), model["id"])
+    return {
+        "brand": {normalize_text(brand["name"]): brand["id"] for brand in brands},
+        "model": model_ids,
+        "category": {normalize_text(category["name"]): category["id"] for category in categories}
+    }
+
+def parse_import_row(raw: dict, lookups: Dict[str, dict]) -> tuple:
+    # Returns (product data, errors); brand, model and category may be
+    # given by name instead of id
+    row = {
+        str(key).strip().lower(): value.strip() if isinstance(value, str) else value
+        for key, value in raw.items() if key
+    }
+    row = {key: value for key, value in row.items() if value not in ("", None)}
+    errors = []
+    
+    for entity_type in ("brand", "category", "model"):
+        name = row.pop(entity_type, None) or row.pop(f"{entity_type}_name", None)
+        column = f"{entity_type}_id"
+        if not name or column in row:
+            continue
+        normalized = normalize_text(str(name))
+        if entity_type != "model":
+            entity_id = lookups[entity_type].get(normalized)
+        elif "brand_id" in row:
+            # A model name only counts within the row's brand, so the
+            # product never pairs one brand with another brand's model
+            try:
+                brand_id = int(row["brand_id"])
+            except (TypeError, ValueError):
+                continue  # Reported by validation
+            entity_id = lookups["model"].get((brand_id, normalized))
+            if entity_id is None:
+                errors.append(f"Unknown model for brand: {name}")
+                continue
+        else:
+            entity_id = lookups["model"].get((None, normalized))
+        if entity_id is None:
+            errors.append(f"Unknown {entity_type}: {name}")
+        else:
+            row[column] = entity_id
+    
+    if isinstance(row.get("images"), str):
+        row["images"] = [url.strip() for url in row["images"].split("|") if url.strip()]
+    values = {key: value for key, value in row.items() if key in Product.model_fields}
+    
+    try:
+        product = Product(**{"image_url": "", **values})
+    except ValidationError as e:
+        errors.extend(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+        return None, errors
+    if errors:
+        return None, errors
+    
+    # Rows carrying an id update that product and only write the columns
+    # the file supplied, so images, ratings and links it leaves out are
+    # kept; the rest are inserted with the model defaults
+    if product.id is not None:
+        return product.model_dump(include=set(values)), []
+    return product.model_dump(exclude={"id"}), []
+
+def import_error(job: dict, row_number: int, errors: List[str]) -> None:
+    job["failed"] += 1
+    if len(job["errors"]) < MAX_IMPORT_ERRORS:
+        job["errors"].append({"row": row_number, "errors": errors})
+
+async def write_import_batch(job: dict, rows: List[tuple], upsert: bool) -> List[int]:
+    # One request per batch; if it is rejected, rows are retried one by one
+    # so the report can point at the offending ones
+    if not rows:
+        return []
+    
+    def write(payload):
+        table = supabase.table("products")
+        return table.upsert(payload, on_conflict="id") if upsert else table.insert(payload)
+    
+    counter = "updated" if upsert else "inserted"
+    try:
+        result = await db_execute(write([data for _, data in rows]))
+        job[counter] += len(result.data)
+        return [product["id"] for product in result.data]
+    except Exception:
+        written = []
+        for row_number, data in rows:
+            try:
+                result = await db_execute(write(data))
+                job[counter] += 1
+                written.append(result.data[0]["id"])
+            except Exception as e:
+                import_error(job, row_number, [str(e)])
+        return written
+
+async def run_import(job: dict, path: str, import_format: str) -> None:
+    job["status"] = "running"
+    save_import_job(job)
+    rows = iter_import_rows(path, import_format)
+    try:
+        lookups = await load_import_lookups()
+        while True:
+            batch = await run_blocking(partial(list, islice(rows, IMPORT_BATCH_SIZE)))
+            if not batch:
+                break
+            
+            # A bulk upsert writes the same columns for every row, so updates
+            # are grouped by the columns they set
+            inserts, upserts = [], {}
+            for raw, error in batch:
+                job["rows"] += 1
+                data, errors = parse_import_row(raw, lookups) if raw is not None else (None, [error])
+                if errors:
+                    import_error(job, job["rows"], errors)
+                elif "id" in data:
+                    upserts.setdefault(tuple(sorted(data)), []).append((job["rows"], data))
+                else:
+                    inserts.append((job["rows"], data))
+            
+            product_ids = await write_import_batch(job, inserts, False)
+            for rows_with_columns in upserts.values():
+                product_ids += await write_import_batch(job, rows_with_columns, True)
+            if product_ids:
+                invalidate_catalog("products", products=product_ids)
+                await reindex_products(product_ids)
+            save_import_job(job)
+        
+        job["status"] = "completed"
+    except asyncio.CancelledError:
+        logger.error(f"Product import {job['id']} interrupted by shutdown")
+        job["status"] = "interrupted"
+        raise
+    except Exception as e:
+        logger.error(f"Product import {job['id']} failed: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        rows.close()
+        os.remove(path)
+        job["finished_at"] = datetime.utcnow().isoformat()
+        save_import_job(job)
+        logger.info(
+            f"Product import {job['id']} {job['status']}: {job['inserted']} inserted, "
+            f"{job['updated']} updated, {job['failed']} failed"
+        )
+
+@app.post("/api/products/import", status_code=202)
+async def import_products(
+    file: UploadFile = File(...),
+    import_format: Optional[str] = Form(None, alias="format"),
+    admin=Depends(verify_admin_token)
+):
+    import_format = import_format or ("csv" if (file.filename or "").lower().endswith(".csv") else "ndjson")
+    if import_format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be one of: csv, ndjson")
+    
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=f".{import_format}")
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > settings.MAX_IMPORT_SIZE:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"File too large (max {settings.MAX_IMPORT_SIZE / 1024 / 1024}MB)"
+                    )
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "filename": file.filename,
+        "format": import_format,
+        "created_at": datetime.utcnow().isoformat(),
+        "finished_at": None,
+        "rows": 0,
+        "inserted": 0,
+        "updated": 0,
+        "failed": 0,
+        "errors": []
+    }
+    import_jobs[job_id] = job
+    while len(import_jobs) > MAX_IMPORT_JOBS:
+        oldest = next(iter(import_jobs.values()))
+        if oldest["finished_at"] is None:
+            break
+        import_jobs.popitem(last=False)
+    save_import_job(job)
+    prune_import_jobs()
+    
+    task = asyncio.create_task(run_import(job, path, import_format))
+    import_tasks.add(task)
+    task.add_done_callback(import_tasks.discard)
+    
+    logger.info(f"Product import {job_id} queued: {file.filename} ({size} bytes)")
+    return {"job_id": job_id, "status": job["status"], "status_url": f"/api/products/import/{job_id}"}
+
+@app.get("/api/products/import/{job_id}")
+async def get_import_job(job_id: str, admin=Depends(verify_admin_token)):
+    job = import_jobs.get(job_id) or load_import_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
 # Search
 @app.get("/api/search/suggestions")
 async def get_search_suggestions(q: str):
@@ -733,13 +3062,16 @@ async def get_search_suggestions(q: str):
         if not q or len(q) < 2:
             return []
         
+        if autocomplete_index.ready:
+            return autocomplete_index.suggest(q)
+        
         normalized_query = normalize_text(q)
         suggestions = []
         
-        brands = supabase.table("car_brands").select("name").limit(10).execute()
-        models = supabase.table("car_models").select("name").limit(10).execute()
-        categories = supabase.table("categories").select("name").limit(10).execute()
-        products = supabase.table("products").select("name").limit(5).execute()
+        brands = await db_execute(supabase.table("car_brands").select("name").limit(10))
+        models = await db_execute(supabase.table("car_models").select("name").limit(10))
+        categories = await db_execute(supabase.table("categories").select("name").limit(10))
+        products = await db_execute(supabase.table("products").select("name").limit(5))
         
         for brand in brands.data:
             brand_name = brand.get('name', '')
@@ -774,9 +3106,15 @@ async def get_search_suggestions(q: str):
         return []
 
 @app.get("/api/search/popular")
-async def get_popular_searches():
+async def get_popular_searches(rank_by: str = "products"):
     try:
-        brands_query = supabase.table("products").select("brand_id, car_brands(name)").execute()
+        if rank_by not in PopularityStats.RANKINGS:
+            raise HTTPException(status_code=400, detail="Invalid rank_by")
+        
+        if search_index.ready and autocomplete_index.ready:
+            return popularity_stats.popular(rank_by)
+        
+        brands_query = await db_execute(supabase.table("products").select("brand_id, car_brands(name)"))
         brand_counts = {}
         for item in brands_query.data:
             if item.get('car_brands'):
@@ -785,7 +3123,7 @@ async def get_popular_searches():
         
         top_brands = sorted(brand_counts.items(), key=lambda x: x[1], reverse=True)[:5]
         
-        categories_query = supabase.table("products").select("category_id, categories(name)").execute()
+        categories_query = await db_execute(supabase.table("products").select("category_id, categories(name)"))
         category_counts = {}
         for item in categories_query.data:
             if item.get('categories'):
@@ -802,38 +3140,109 @@ async def get_popular_searches():
                 popular.append(category)
         
         return popular[:10]
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Popular searches failed: {str(e)}")
         return []
 
+# Cart
+DEPOSIT_RATE = 0.5
+
+@app.post("/api/cart/quote")
+async def quote_cart(quote: CartQuote):
+    try:
+        requested: Dict[int, int] = {}
+        for item in quote.items:
+            requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+        
+        products = await get_products_by_id(list(requested))
+        
+        items = []
+        total = 0
+        for product_id, quantity in requested.items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            price = float(product["price"])
+            subtotal = price * quantity
+            total += subtotal
+            items.append({
+                "product_id": product_id,
+                "product_name": product["name"],
+                "price": price,
+                "quantity": quantity,
+                "subtotal": subtotal,
+                "stock_quantity": product["stock_quantity"],
+                "available": product["stock_quantity"] >= quantity
+            })
+        
+        missing = [product_id for product_id in requested if product_id not in products]
+        return ORJSONResponse({
+            "items": items,
+            "missing": missing,
+            "total_amount": total,
+            "deposit_amount": total * DEPOSIT_RATE,
+            "available": not missing and all(item["available"] for item in items)
+        })
+    except Exception as e:
+        logger.error(f"Cart quote failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to quote cart")
+
 # Orders
 @app.post("/api/orders", status_code=201)
 async def create_order(order: OrderCreate):
     try:
+        product_ids = list({item.product_id for item in order.items})
+        products_result = await db_execute(
+            supabase.table("products").select("id, price, name, stock_quantity").in_("id", product_ids)
+        )
+        products = {product["id"]: product for product in products_result.data}
+        
+        missing = [product_id for product_id in product_ids if product_id not in products]
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail={
+                    "message": "Products not found",
+                    "items": [{"product_id": product_id} for product_id in sorted(missing)]
+                }
+            )
+        
+        requested: Dict[int, int] = {}
+        for item in order.items:
+            requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+        
+        shortages = [
+            {
+                "product_id": product_id,
+                "product_name": products[product_id]["name"],
+                "requested": quantity,
+                "available": products[product_id]["stock_quantity"]
+            }
+            for product_id, quantity in requested.items()
+            if products[product_id]["stock_quantity"] < quantity
+        ]
+        if shortages:
+            raise HTTPException(
+                status_code=400,
+                detail={"message": "Insufficient stock", "items": shortages}
+            )
+        
         total = 0
         items_with_prices = []
-        
         for item in order.items:
-            product = supabase.table("products").select("price, name, stock_quantity").eq("id", item.product_id).execute()
-            if not product.data:
-                raise HTTPException(status_code=404, detail=f"Product {item.product_id} not found")
-            
-            if product.data[0]["stock_quantity"] < item.quantity:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Insufficient stock for {product.data[0]['name']}"
-                )
-            
-            price = float(product.data[0]["price"])
+            product = products[item.product_id]
+            price = float(product["price"])
             total += price * item.quantity
             items_with_prices.append({
                 "product_id": item.product_id,
                 "quantity": item.quantity,
                 "price": price,
-                "product_name": product.data[0]["name"]
+                "product_name": product["name"]
             })
         
-        deposit = total * 0.5
+        deposit = total * DEPOSIT_RATE
         
         order_data = {
             "customer_name": order.customer_name,
@@ -846,16 +3255,28 @@ async def create_order(order: OrderCreate):
             "status": "pending"
         }
         
-        order_result = supabase.table("orders").insert(order_data).execute()
+        order_result = await db_execute(supabase.table("orders").insert(order_data))
         order_id = order_result.data[0]["id"]
         
+        try:
+            await db_execute(supabase.table("order_items").insert([
+                {
+                    "order_id": order_id,
+                    "product_id": item["product_id"],
+                    "quantity": item["quantity"],
+                    "price": item["price"]
+                }
+                for item in items_with_prices
+            ]))
+        except Exception:
+            # Don't leave an order without line items behind
+            await db_execute(supabase.table("orders").delete().eq("id", order_id))
+            raise
+        
         for item in items_with_prices:
-            supabase.table("order_items").insert({
-                "order_id": order_id,
-                "product_id": item["product_id"],
-                "quantity": item["quantity"],
-                "price": item["price"]
-            }).execute()
+            popularity_stats.record_order(item["product_id"], item["quantity"])
+        order_stats.record_order(order_result.data[0], items_with_prices)
+        publish_order_event(order_result.data[0], items_with_prices)
         
         logger.info(f"Order created: {order_id}")
         return order_result.data[0]
@@ -867,31 +3288,175 @@ async def create_order(order: OrderCreate):
 
 @app.get("/api/orders")
 async def get_orders(
+    response: Response,
     admin=Depends(verify_admin_token),
     status_filter: Optional[str] = None,
     limit: int = 50,
-    offset: int = 0
+    offset: int = 0,
+    cursor: Optional[str] = None
 ):
     try:
-        query = supabase.table("orders").select("*").order("created_at", desc=True)
+        after = decode_cursor(cursor, "created_at") if cursor else None
+        query = supabase.table("orders").select("*").order("created_at", desc=True).order("id", desc=True)
         
         if status_filter:
             query = query.eq("status", status_filter)
         
-        query = query.range(offset, offset + limit - 1)
-        result = query.execute()
+        if after is not None:
+            query = query.or_(keyset_filter("created_at", True, after)).limit(limit)
+        else:
+            query = query.range(offset, offset + limit - 1)
+        result = await db_execute(query)
+        
+        if len(result.data) == limit:
+            last = result.data[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor("created_at", (last["created_at"], last["id"]))
         return result.data
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch orders")
 
+# Order export
+EXPORT_BATCH_SIZE = 200
+EXPORT_ITEMS_PAGE = 1000
+EXPORT_ORDER_FIELDS = [
+    "id", "created_at", "status", "customer_name", "customer_email", "customer_phone",
+    "customer_address", "payment_method", "total_amount", "deposit_amount"
+]
+EXPORT_ITEM_FIELDS = ["product_id", "product_name", "brand_name", "model_name", "category_name", "quantity", "price"]
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+async def fetch_order_items(order_ids: List[int]) -> Dict[int, List[dict]]:
+    # PostgREST caps response size, so items are paged even within a batch
+    items: Dict[int, List[dict]] = {order_id: [] for order_id in order_ids}
+    offset = 0
+    while True:
+        result = await db_execute(
+            supabase.table("order_items").select("*").in_("order_id", order_ids)
+            .order("order_id").order("id").range(offset, offset + EXPORT_ITEMS_PAGE - 1)
+        )
+        for item in result.data:
+            items[item["order_id"]].append(item)
+        if len(result.data) < EXPORT_ITEMS_PAGE:
+            return items
+        offset += EXPORT_ITEMS_PAGE
+
+async def export_order_batches(
+    status_filter: Optional[str],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime]
+):
+    # Yields (order, items) batches newest first; memory is bounded by one
+    # batch no matter how many orders match
+    after = None
+    while True:
+        query = supabase.table("orders").select("*").order("created_at", desc=True).order("id", desc=True)
+        if status_filter:
+            query = query.eq("status", status_filter)
+        if date_from:
+            query = query.gte("created_at", date_from.isoformat())
+        if date_to:
+            query = query.lte("created_at", date_to.isoformat())
+        if after is not None:
+            query = query.or_(keyset_filter("created_at", True, after))
+        orders = (await db_execute(query.limit(EXPORT_BATCH_SIZE))).data
+        if not orders:
+            return
+        
+        items = await fetch_order_items([order["id"] for order in orders])
+        product_ids = list({item["product_id"] for rows in items.values() for item in rows})
+        products = await get_products_by_id(product_ids) if product_ids else {}
+        
+        batch = []
+        for order in orders:
+            lines = []
+            for item in items[order["id"]]:
+                product = products.get(item["product_id"]) or {}
+                lines.append({
+                    "product_id": item["product_id"],
+                    "product_name": product.get("name"),
+                    "brand_name": product.get("brand_name"),
+                    "model_name": product.get("model_name"),
+                    "category_name": product.get("category_name"),
+                    "quantity": item["quantity"],
+                    "price": item["price"]
+                })
+            batch.append((order, lines))
+        yield batch
+        
+        if len(orders) < EXPORT_BATCH_SIZE:
+            return
+        after = (orders[-1]["created_at"], orders[-1]["id"])
+
+async def stream_ndjson(batches):
+    async for batch in batches:
+        yield b"".join(
+            orjson.dumps({**{field: order.get(field) for field in EXPORT_ORDER_FIELDS}, "items": lines}) + b"\n"
+            for order, lines in batch
+        )
+
+async def stream_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["order_id"] + EXPORT_ORDER_FIELDS[1:] + EXPORT_ITEM_FIELDS)
+    async for batch in batches:
+        for order, lines in batch:
+            head = [order.get(field) for field in EXPORT_ORDER_FIELDS]
+            # Orders without items still get a row
+            for line in lines or [{}]:
+                writer.writerow(head + [line.get(field) for field in EXPORT_ITEM_FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+# Last record of an export that failed part way. The status line is already
+# sent by then, and raising would not help: the http middlewares still end
+# the body cleanly, and GZip loses whatever it had buffered. The error is
+# written in-band instead so a truncated file never looks complete
+EXPORT_ERROR_RECORDS = {
+    "ndjson": orjson.dumps({"error": "Export failed; the file is incomplete"}) + b"\n",
+    "csv": "ERROR,Export failed; the file is incomplete\r\n",
+}
+
+async def log_export_errors(chunks, export_format: str):
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except Exception as e:
+        logger.error(f"Order export failed: {str(e)}")
+        yield EXPORT_ERROR_RECORDS[export_format]
+
+# Registered before /api/orders/{order_id} so "export" is not parsed as an id
+@app.get("/api/orders/export")
+async def export_orders(
+    admin=Depends(verify_admin_token),
+    export_format: str = Query("ndjson", alias="format"),
+    status_filter: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    
+    batches = export_order_batches(status_filter, date_from, date_to)
+    chunks = stream_csv(batches) if export_format == "csv" else stream_ndjson(batches)
+    filename = f"orders-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return StreamingResponse(
+        log_export_errors(chunks, export_format),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.get("/api/orders/{order_id}")
 async def get_order(order_id: int, admin=Depends(verify_admin_token)):
     try:
-        order = supabase.table("orders").select("*").eq("id", order_id).execute()
+        order = await db_execute(supabase.table("orders").select("*").eq("id", order_id))
         if not order.data:
             raise HTTPException(status_code=404, detail="Order not found")
         
-        items = supabase.table("order_items").select("*, products(*)").eq("order_id", order_id).execute()
+        items = await db_execute(supabase.table("order_items").select("*, products(*)").eq("order_id", order_id))
         
         return {
             **order.data[0],
@@ -905,12 +3470,12 @@ async def get_order(order_id: int, admin=Depends(verify_admin_token)):
 @app.get("/api/orders/{order_id}/details")
 async def get_order_details(order_id: int, admin=Depends(verify_admin_token)):
     try:
-        order_result = supabase.table("orders").select("*").eq("id", order_id).execute()
+        order_result = await db_execute(supabase.table("orders").select("*").eq("id", order_id))
         if not order_result.data:
             raise HTTPException(status_code=404, detail="Order not found")
         order = order_result.data[0]
 
-        items_result = supabase.table("order_items").select("""
+        items_result = await db_execute(supabase.table("order_items").select("""
             *,
             products(
                 *,
@@ -918,7 +3483,7 @@ async def get_order_details(order_id: int, admin=Depends(verify_admin_token)):
                 car_models(id, name),
                 categories(id, name)
             )
-        """).eq("order_id", order_id).execute()
+        """).eq("order_id", order_id))
         items = items_result.data
 
         total_amount = sum(item["price"] * item["quantity"] for item in items)
@@ -966,10 +3531,25 @@ async def update_order_status(
         if status not in valid_statuses:
             raise HTTPException(status_code=400, detail="Invalid status")
         
-        result = supabase.table("orders").update({"status": status}).eq("id", order_id).execute()
+        previous = await db_execute(supabase.table("orders").select("id, status").eq("id", order_id))
+        if not previous.data:
+            raise HTTPException(status_code=404, detail="Order not found")
+        previous_status = previous.data[0]["status"]
+        
+        result = await db_execute(supabase.table("orders").update({"status": status}).eq("id", order_id))
         if not result.data:
             raise HTTPException(status_code=404, detail="Order not found")
         
+        # Line items only matter when the order moves in or out of "cancelled"
+        items = None
+        if (order_stats.ready or order_sync is not None) and (previous_status == "cancelled") != (status == "cancelled"):
+            items = (await db_execute(
+                supabase.table("order_items").select("product_id, quantity").eq("order_id", order_id)
+            )).data
+        order_stats.record_status_change(result.data[0], previous_status, items)
+        if previous_status != status:
+            publish_order_event(result.data[0], items, previous_status)
+        
         logger.info(f"Order status updated: {order_id} -> {status}")
         return result.data[0]
     except HTTPException:
@@ -981,17 +3561,18 @@ async def update_order_status(
 @app.post("/api/auth/register", status_code=201)
 async def register(user: User):
     try:
-        result = supabase.auth.sign_up({
+        result = await run_blocking(supabase.auth.sign_up, {
             "email": user.email,
             "password": user.password
         })
         
         if result.user:
-            supabase.table("users").insert({
+            await db_execute(supabase.table("users").insert({
                 "id": result.user.id,
                 "email": user.email,
                 "role": "customer"
-            }).execute()
+            }))
+            set_user_role(result.user.id, "customer")
         
         logger.info(f"User registered: {user.email}")
         return {"message": "User registered successfully", "email": user.email}
@@ -1002,13 +3583,14 @@ async def register(user: User):
 @app.post("/api/auth/login")
 async def login(user: User):
     try:
-        result = supabase.auth.sign_in_with_password({
+        result = await run_blocking(supabase.auth.sign_in_with_password, {
             "email": user.email,
             "password": user.password
         })
         
-        user_data = supabase.table("users").select("role").eq("id", result.user.id).execute()
+        user_data = await db_execute(supabase.table("users").select("role").eq("id", result.user.id))
         role = user_data.data[0].get("role") if user_data.data else "customer"
+        set_user_role(result.user.id, role)
         
         logger.info(f"User logged in: {user.email}")
         return {
@@ -1026,7 +3608,7 @@ async def login(user: User):
 @app.post("/api/auth/logout")
 async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        supabase.auth.sign_out()
+        await run_blocking(supabase.auth.sign_out)
         return {"message": "Logged out successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail="Logout failed")
@@ -1034,18 +3616,11 @@ async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
 @app.get("/api/auth/me")
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        response = supabase.auth.get_user(credentials.credentials)
-        
-        if not response or not response.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_data = supabase.table("users").select("role").eq("id", response.user.id).execute()
-        role = user_data.data[0].get("role") if user_data.data else "customer"
-        
+        user = await authenticate(credentials.credentials)
         return {
-            "id": response.user.id,
-            "email": response.user.email,
-            "role": role
+            "id": user.id,
+            "email": user.email,
+            "role": user.role
         }
     except HTTPException:
         raise
@@ -1075,12 +3650,5 @@ async def api_root():
     }
 
 if __name__ == "__main__":
-    import uvicorn
-    port = int(os.getenv("PORT", 8000))
-    logger.info(f"🚀 Starting on port {port}")
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=port,
-        log_level="info"
-    )
+    from start import serve
+    serve()
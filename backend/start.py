@@ -1,15 +1,116 @@
 import os
+import random
+import shutil
+import sys
+import tempfile
 import uvicorn
+from uvicorn.supervisors import Multiprocess
 
-if __name__ == "__main__":
+def available_cpus() -> int:
+    # Containers often see every host CPU; honour the cgroup quota if set
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def installed(module: str) -> bool:
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+class RecyclingConfig(uvicorn.Config):
+    # Each worker loads its own copy of the config, so each one draws its
+    # own extra requests and they are not all recycled (and reloading their
+    # indexes) at the same moment
+    def __init__(self, *args, max_requests_jitter: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_requests_jitter = max_requests_jitter
+
+    def load(self) -> None:
+        super().load()
+        if self.limit_max_requests and self.max_requests_jitter:
+            self.limit_max_requests += random.randint(0, self.max_requests_jitter)
+
+class RecyclingServer(uvicorn.Server):
+    # A worker that has reached its request limit keeps serving until its
+    # product imports finish, so recycling never cuts one off half-written
+    async def on_tick(self, counter: int) -> bool:
+        main = sys.modules.get("main")
+        if self.config.limit_max_requests is None or main is None or not main.imports_running():
+            return await super().on_tick(counter)
+        limit, self.config.limit_max_requests = self.config.limit_max_requests, None
+        try:
+            return await super().on_tick(counter)
+        finally:
+            self.config.limit_max_requests = limit
+
+def remove_sync_files(path: str) -> None:
+    # Journals and import records only describe the running server
+    for name in (path, f"{path}.orders"):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+    shutil.rmtree(f"{path}.imports", ignore_errors=True)
+
+def serve() -> None:
     port = int(os.getenv("PORT", "8000"))
-    print(f"🚀 Starting on port {port}")
-    
-    uvicorn.run(
+    # Each worker runs its own event loop and Supabase thread pool, so one
+    # per CPU is enough to keep every core busy
+    workers = int(os.getenv("WEB_CONCURRENCY", available_cpus()))
+    # Workers exit gracefully after this many requests and the supervisor
+    # starts a fresh one, which caps memory growth. A single process has no
+    # supervisor to replace it, so recycling needs at least two workers
+    max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+    max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", max_requests // 10))
+    loop = "uvloop" if installed("uvloop") else "asyncio"
+    http = "httptools" if installed("httptools") else "h11"
+
+    if workers > 1:
+        # Workers keep their own caches, indexes and order stats; catalog
+        # writes and orders in one of them reach the others through this
+        # file (and its .orders companion), and import jobs are saved in
+        # its .imports directory so any worker can report on them
+        os.environ.setdefault("CATALOG_SYNC_FILE", os.path.join(tempfile.gettempdir(), f"catalog-sync-{os.getpid()}"))
+        remove_sync_files(os.environ["CATALOG_SYNC_FILE"])
+        if not os.getenv("REDIS_URL"):
+            print("⚠️  REDIS_URL is not set: rate limits are enforced per worker")
+
+    print(f"🚀 Starting on port {port} with {workers} worker(s), loop={loop}, http={http}")
+
+    config = RecyclingConfig(
         "main:app",
         host="0.0.0.0",
         port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
         log_level="info",
         timeout_keep_alive=75,
-        access_log=True
+        timeout_graceful_shutdown=30,
+        limit_max_requests=max_requests if workers > 1 and max_requests else None,
+        max_requests_jitter=max_requests_jitter,
+        access_log=os.getenv("ACCESS_LOG", "true").lower() == "true"
     )
+    server = RecyclingServer(config)
+    # Same dispatch as uvicorn.run, which only accepts its own Config
+    if workers > 1:
+        try:
+            Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+        finally:
+            remove_sync_files(os.environ["CATALOG_SYNC_FILE"])
+    else:
+        server.run()
+
+if __name__ == "__main__":
+    serve()